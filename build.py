@@ -0,0 +1,149 @@
+import os
+import re
+import sys
+import shutil
+import tomllib
+import zipapp
+import py_compile
+import tempfile
+from pathlib import Path
+from importlib import metadata
+
+from io import BytesIO
+from src.document import _styled_docx, _template_name
+from src.reproducible import EPOCH, _write_zip
+from src.styles import Style
+from src.utils import _err_exit
+
+CLI_HELP = """
+构建单文件 zipapp, 适用于冷启动耗时敏感的环境 (如 serverless 函数)
+使用方法: python build.py [out] [options]
+选项:
+  --help         显示此帮助信息
+  --compress     压缩 zipapp (更小, 但加载稍慢)
+
+输出默认为 dist/mdcx.pyz, 运行方式: python mdcx.pyz [in] [out] [options]
+"""
+
+ROOT = Path(__file__).parent
+# Dependencies with C extensions, which can't be imported from inside a zip so have to be installed
+NATIVE = ("lxml", "pillow")
+# Files in dependencies which are never needed at runtime; python-docx opens its templates from the
+# filesystem so they can't be used from inside a zip anyway, which is why ours are embedded
+SKIP_SUFFIXES = (".pyc", ".pyi", ".so", ".pyd", ".typed", ".js")
+SKIP_DIRS = ("__pycache__", "tests", "templates")
+
+
+def main():
+    args = sys.argv[1:]
+    if "--help" in args:
+        print(CLI_HELP)
+        sys.exit(0)
+    positional = [arg for arg in args if not arg.startswith("--")]
+    out = Path(positional[0]) if positional else ROOT / "dist" / "mdcx.pyz"
+
+    # Check native dependencies are there, as the zipapp runs against them
+    for name in NATIVE:
+        try:
+            metadata.distribution(name)
+        except metadata.PackageNotFoundError:
+            _err_exit(f"构建环境缺少依赖 '{name}'")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        staging = Path(tmp)
+
+        # Precompiled mdcx, with an entry point which checks the bytecode can be loaded
+        for path in sorted((ROOT / "src").glob("*.py")):
+            _compile(path, staging / "src" / path.name, f"src/{path.name}")
+        _compile(ROOT / "main.py", staging / "main.py", "main.py")
+        (staging / "__main__.py").write_text(
+            "import sys\n"
+            f"if sys.version_info[:2] != {tuple(sys.version_info[:2])}:\n"
+            f'    sys.exit("mdcx.pyz 需要 Python {sys.version_info[0]}.{sys.version_info[1]}")\n'
+            "from main import main\n"
+            "main()\n",
+            encoding="utf-8",
+        )
+
+        # Default templates, built now instead of on every cold start
+        templates = staging / "src" / "templates"
+        templates.mkdir()
+        for style in (Style.andy(), Style.foxtrot()):
+            buf = BytesIO()
+            _write_zip(_styled_docx(style), buf, EPOCH)
+            (templates / _template_name(style)).write_bytes(buf.getvalue())
+
+        # Precompiled pure-python dependencies
+        for dist in _dependencies():
+            for file in dist.files or []:
+                _vendor(dist, file, staging)
+
+        # Fixed times and sorted entries so the same sources always build the same zipapp
+        for path in staging.rglob("*"):
+            os.utime(path, (EPOCH.timestamp(), EPOCH.timestamp()))
+        out.parent.mkdir(parents=True, exist_ok=True)
+        zipapp.create_archive(
+            staging, out, interpreter="/usr/bin/env python3", compressed="--compress" in args
+        )
+
+    print(f"已构建 {out} ({out.stat().st_size // 1024} KiB)")
+    print(f"运行环境需安装: {', '.join(NATIVE)}")
+
+
+def _dependencies() -> list[metadata.Distribution]:
+    """Gets installed distributions mdcx depends on, directly or not, leaving out native ones"""
+    with open(ROOT / "pyproject.toml", "rb") as file:
+        pending = [name for name in tomllib.load(file)["tool"]["poetry"]["dependencies"] if name != "python"]
+    seen = set()
+    dists = []
+    while pending:
+        name = _normalise(pending.pop())
+        if name in seen:
+            continue
+        seen.add(name)
+        dist = metadata.distribution(name)
+        if name not in NATIVE:
+            dists.append(dist)
+        for requirement in dist.requires or []:
+            # Optional extras aren't needed
+            if "extra ==" in requirement:
+                continue
+            pending.append(re.match(r"[A-Za-z0-9._-]+", requirement).group(0))
+    return sorted(dists, key=lambda dist: _normalise(dist.metadata["Name"]))
+
+
+def _vendor(dist: metadata.Distribution, file: metadata.PackagePath, staging: Path):
+    """Copies a single file of a dependency into the zipapp, compiling it if it's code"""
+    parts = file.parts
+    # Leave out metadata, scripts outside site-packages, caches, tests and native code
+    if parts[0] == ".." or parts[0].endswith(".dist-info") or any(part in SKIP_DIRS for part in parts):
+        return
+    if file.name.endswith(SKIP_SUFFIXES):
+        return
+    path = Path(dist.locate_file(file))
+    if file.suffix == ".py":
+        _compile(path, staging / file, file.as_posix())
+    else:
+        (staging / file).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, staging / file)
+
+
+def _compile(path: Path, out: Path, name: str):
+    """Compiles a source file into sourceless bytecode, which zipimport loads as is"""
+    out.parent.mkdir(parents=True, exist_ok=True)
+    py_compile.compile(
+        str(path),
+        cfile=str(out.with_suffix(".pyc")),
+        dfile=name,
+        doraise=True,
+        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+    )
+
+
+def _normalise(name: str) -> str:
+    """Normalises distribution name like pip does, e.g. `Charset_Normalizer` to `charset-normalizer`"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+if __name__ == "__main__":
+    main()
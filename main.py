@@ -1,4 +1,5 @@
 import sys
+import multiprocessing
 from pathlib import Path
 
 # 添加 src 目录到 Python 路径
@@ -6,13 +7,30 @@ sys.path.append(str(Path(__file__).parent / "src"))
 
 from src.document import Document
 from src.styles import Style
+from src.manifest import Manifest, check, _output_options
+from src.converter import Converter
+from src.batch import WorkQueue, work, _build_key
+from src.book import Book
 from src.utils import get_docx_path, _err_exit
 
 CLI_HELP = """
 使用方法: python -m src.main [in] [out] [options]
 选项:
-  --help     显示此帮助信息
-  --foxtrot  使用 Foxtrot 样式
+  --help         显示此帮助信息
+  --foxtrot      使用 Foxtrot 样式
+  --incremental  输出已是最新时跳过转换
+  --force        忽略构建清单, 强制重新转换
+  --events       以 JSON 行格式将转换进度输出到 stderr
+  --deterministic 相同输入总是生成字节完全相同的 docx (可设置 SOURCE_DATE_EPOCH)
+
+批量模式: python -m src.main [in 目录] [out 目录] --batch [options]
+  --workers N    本机启动 N 个工作进程 (默认 1)
+  --queue DIR    共享队列目录, 多台主机使用同一目录即可协同转换 (默认 [out]/.mdcx-queue)
+  --lease S      工作进程崩溃后其认领在 S 秒后过期并被重试 (默认 300)
+  --report       只输出汇总报告
+
+书籍模式: python -m src.main [章节目录 或 章节清单] [out] --book [options]
+  将多个章节按顺序合并为一个 docx; 清单每行一个章节路径, 可用 --- 包围的 title/subtitle 元数据
 """
 
 def main():
@@ -24,9 +42,26 @@ def main():
         sys.exit(0)
 
     foxtrot = "--foxtrot" in args[2:]
+    force = "--force" in args[2:]
+    incremental = "--incremental" in args[2:] or force
+    listener = _print_event if "--events" in args[2:] else None
+    deterministic = "--deterministic" in args[2:]
     md_path = Path(args[0])
     docx_path = get_docx_path(args, md_path)
 
+    # Batch mode over whole directories
+    if "--batch" in args[2:] or "--report" in args[2:]:
+        _batch(md_path, docx_path, args[2:], foxtrot, incremental, force, deterministic)
+        return
+
+    # Book mode assembling many chapters
+    if "--book" in args[2:]:
+        if not md_path.exists():
+            _err_exit(f"章节目录或清单 '{args[0]}' 不存在")
+        style = Style.andy() if not foxtrot else Style.foxtrot()
+        Book.load(md_path, style, listener=listener).save(docx_path, deterministic=deterministic)
+        return
+
     if not md_path.exists():
         raise Exception(f"Markdown 文件 '{args[0]}' 不存在")
 
@@ -37,7 +72,79 @@ def main():
         _err_exit(f"Markdown 文件 '{args[0]}' 无效 ({e})")
 
     style = Style.andy() if not foxtrot else Style.foxtrot()
-    Document(md, md_path, style).save(docx_path)
+
+    # Skip conversion entirely if output is up-to-date
+    if incremental:
+        reason = "--force" if force else check(md, docx_path, style, _output_options(deterministic))
+        if reason is None:
+            print(f"跳过 {docx_path}: 已是最新")
+            return
+
+    doc = Document(md, md_path, style, listener=listener)
+    doc.save(docx_path, deterministic=deterministic)
+
+    # Record what this output was built from
+    if incremental:
+        Manifest._build(md, doc, style, _output_options(deterministic)).save(docx_path)
+        print(f"已重建 {docx_path}: {reason}")
+
+def _batch(
+    in_dir: Path, out_dir: Path, options: list, foxtrot: bool, incremental: bool, force: bool, deterministic: bool
+):
+    """Converts every markdown file in `in_dir` using a shared work queue, then prints a report"""
+    if not in_dir.is_dir():
+        _err_exit(f"输入目录 '{in_dir}' 不存在")
+    queue_dir = _option(options, "--queue")
+    style = Style.andy() if not foxtrot else Style.foxtrot()
+    queue_args = {
+        "in_dir": in_dir,
+        "out_dir": out_dir,
+        "queue_dir": Path(queue_dir) if queue_dir else None,
+        "lease": float(_option(options, "--lease", 300)),
+        "build": _build_key(style, _output_options(deterministic)),
+        "incremental": incremental,
+    }
+    # Local workers share when this run started, so they agree on what it's done
+    queue_args["started"] = WorkQueue(**queue_args).started
+
+    # Work through queue alongside any other workers using it
+    if "--report" not in options:
+        workers = int(_option(options, "--workers", 1))
+        processes = [
+            multiprocessing.Process(
+                target=_batch_worker, args=(queue_args, foxtrot, force, deterministic)
+            )
+            for _ in range(workers - 1)
+        ]
+        for process in processes:
+            process.start()
+        _batch_worker(queue_args, foxtrot, force, deterministic)
+        for process in processes:
+            process.join()
+
+    # Report on everything done by every worker
+    report = WorkQueue(**queue_args).report()
+    print(f"完成 {report['done']}/{report['total']}: 重建 {report['rebuilt']}, 跳过 {report['skipped']}, 失败 {len(report['failed'])}")
+    print(f"转换耗时合计 {report['seconds']:.2f} 秒")
+    for worker, count in sorted(report["workers"].items()):
+        print(f"  {worker}: {count}")
+    for item, error in report["failed"]:
+        print(f"失败 {item}: {error}")
+
+def _batch_worker(queue_args: dict, foxtrot: bool, force: bool, deterministic: bool):
+    """Single batch worker, which can run in its own process"""
+    converter = Converter(Style.andy() if not foxtrot else Style.foxtrot(), deterministic=deterministic)
+    work(WorkQueue(**queue_args), converter, force)
+
+def _option(options: list, name: str, default=None):
+    """Gets value given after an option like `--workers 4`"""
+    if name in options and options.index(name) + 1 < len(options):
+        return options[options.index(name) + 1]
+    return default
+
+def _print_event(event):
+    """Prints conversion event as a json line to stderr"""
+    print(event._json(), file=sys.stderr, flush=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import random
+import socket
+import hashlib
+import threading
+from pathlib import Path
+from .converter import Converter
+from .manifest import RENDER_VERSION, Manifest, check, _output_options
+from .styles import Style
+
+
+class WorkQueue:
+    """Queue of markdown files in a shared directory which any number of workers on any number
+    of hosts can convert cooperatively, using atomic lock files to claim each file"""
+
+    def __init__(
+        self,
+        in_dir: Path,
+        out_dir: Path,
+        queue_dir: Path | None = None,
+        lease: float = 300,
+        poll: float = 2,
+        build: str = "",
+        incremental: bool = False,
+        started: float | None = None,
+    ) -> None:
+        self.in_dir = in_dir
+        self.out_dir = out_dir
+        self.queue_dir = queue_dir if queue_dir is not None else out_dir / ".mdcx-queue"
+        self.lease = lease  # seconds before a claim without heartbeats is taken over
+        self.poll = poll  # seconds between checks while other workers hold claims
+        self.build = build  # key from `_build_key()`, so changing what outputs are built with converts everything again
+        self.incremental = incremental  # manifests decide what's up-to-date rather than earlier runs' results
+        self.worker = f"{socket.gethostname()}-{os.getpid()}"
+        self.claims = self.queue_dir / "claims"
+        self.done = self.queue_dir / "done"
+        self.failed = self.queue_dir / "failed"
+        self.claims.mkdir(parents=True, exist_ok=True)
+        self.done.mkdir(parents=True, exist_ok=True)
+        self.failed.mkdir(parents=True, exist_ok=True)
+        self.started = started if started is not None else self._now()  # results from before this are from earlier runs
+
+    def items(self) -> list[Path]:
+        """Gets every markdown file to convert, relative to the input directory"""
+        return sorted(path.relative_to(self.in_dir) for path in self.in_dir.rglob("*.md"))
+
+    def is_done(self, item: Path) -> bool:
+        """Checks if the current version of an item has been finished by any worker; failures only
+        count within this run so they're retried next time, as does everything if it's incremental"""
+        name = self._result_name(item)
+        # Removed since items were listed, so there's nothing left to do
+        if name is None:
+            return True
+        if not self.incremental and (self.done / name).exists():
+            return True
+        return self._this_run(self.done / name) or self._this_run(self.failed / name)
+
+    def claim(self, item: Path) -> bool:
+        """Tries to claim an item for this worker, taking over claims which have expired"""
+        path = self._claim_path(item)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._expired(path):
+                    return False
+                # Move expired claim out of the way, which only one worker can win
+                stale = path.with_name(f"{path.name}.{self.worker}.stale")
+                try:
+                    os.rename(path, stale)
+                except FileNotFoundError:
+                    return False
+                # Another worker may have taken it over between checking and moving it, so give it back
+                if not self._expired(stale):
+                    try:
+                        os.link(stale, path)
+                    except FileExistsError:
+                        pass
+                    os.unlink(stale)
+                    return False
+                os.unlink(stale)
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump({"item": item.as_posix(), "worker": self.worker, "claimed": time.time()}, file)
+            return True
+        return False
+
+    def renew(self, item: Path):
+        """Keeps claim on an item from expiring"""
+        try:
+            os.utime(self._claim_path(item))
+        except FileNotFoundError:
+            pass
+
+    def release(self, item: Path):
+        """Gives up claim on an item"""
+        try:
+            os.unlink(self._claim_path(item))
+        except FileNotFoundError:
+            pass
+
+    def finish(self, item: Path, result: dict):
+        """Records result of an item, atomically so the report never sees half a result"""
+        name = self._result_name(item)
+        if name is None:
+            return
+        path, other = (self.failed, self.done) if result["status"] == "failed" else (self.done, self.failed)
+        tmp = path / f"{name}.{self.worker}.tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump({"item": item.as_posix(), "worker": self.worker, **result}, file, ensure_ascii=False)
+        os.replace(tmp, path / name)
+        # Only the latest result of an item is kept
+        try:
+            os.unlink(other / name)
+        except FileNotFoundError:
+            pass
+
+    def report(self) -> dict:
+        """Aggregates results from every worker for the current version of each item"""
+        # Items removed while listing them aren't part of the run any more
+        names = [name for name in map(self._result_name, self.items()) if name is not None]
+        results = []
+        for name in names:
+            for path in (self.done / name, self.failed / name):
+                try:
+                    with open(path, "r", encoding="utf-8") as file:
+                        results.append(json.load(file))
+                    break
+                except (OSError, ValueError):
+                    continue
+        workers = {}
+        for result in results:
+            workers[result["worker"]] = workers.get(result["worker"], 0) + 1
+        return {
+            "total": len(names),
+            "done": len(results),
+            "rebuilt": sum(1 for result in results if result["status"] == "rebuilt"),
+            "skipped": sum(1 for result in results if result["status"] == "skipped"),
+            "failed": sorted(
+                (result["item"], result["error"]) for result in results if result["status"] == "failed"
+            ),
+            "seconds": sum(result["seconds"] for result in results),
+            "workers": workers,
+        }
+
+    def _claim_path(self, item: Path) -> Path:
+        return self.claims / f"{_item_id(item)}.lock"
+
+    def _result_name(self, item: Path) -> str | None:
+        # Changing the source, rendering, style or output options gives it a new name, so it gets converted again;
+        # there's none once it's removed
+        try:
+            stat = (self.in_dir / item).stat()
+        except FileNotFoundError:
+            return None
+        return f"{_item_id(item)}.{stat.st_mtime_ns:x}.{stat.st_size:x}.{self.build}.json"
+
+    def _now(self) -> float:
+        """Gets current time by the queue directory's clock, which results are timestamped with
+        and might not agree with this host's clock or keep as many digits"""
+        path = self.queue_dir / f"clock.{self.worker}"
+        path.touch()
+        try:
+            return path.stat().st_mtime
+        finally:
+            path.unlink()
+
+    def _this_run(self, path: Path) -> bool:
+        try:
+            return path.stat().st_mtime >= self.started
+        except FileNotFoundError:
+            return False
+
+    def _expired(self, path: Path) -> bool:
+        try:
+            return time.time() - path.stat().st_mtime > self.lease
+        except FileNotFoundError:
+            # Released just now, so try claiming again next time round
+            return False
+
+
+def work(queue: WorkQueue, converter: Converter, force: bool = False) -> int:
+    """Converts items claimed from `queue` until every item is done, returning how many this worker did"""
+    count = 0
+    while True:
+        pending = [item for item in queue.items() if not queue.is_done(item)]
+        if not pending:
+            return count
+        # Spread workers out over the queue so they don't fight over the same claims
+        random.shuffle(pending)
+        progressed = False
+        for item in pending:
+            if not queue.claim(item):
+                continue
+            try:
+                # Another worker might have finished it since we listed items
+                if queue.is_done(item):
+                    continue
+                with _Heartbeat(queue, item):
+                    result = _convert(queue, converter, item, force)
+                queue.finish(item, result)
+                count += 1
+                progressed = True
+            finally:
+                queue.release(item)
+        # Everything left is claimed by others, so wait for them to finish or expire
+        if not progressed:
+            time.sleep(queue.poll)
+
+
+def _convert(queue: WorkQueue, converter: Converter, item: Path, force: bool) -> dict:
+    """Converts a single item, returning its result"""
+    started = time.monotonic()
+    md_path = queue.in_dir / item
+    docx_path = queue.out_dir / item.with_suffix(".docx")
+    try:
+        with open(md_path, "r", encoding="utf-8") as file:
+            md = file.read()
+        options = _output_options(converter.deterministic)
+        reason = "--force" if force or not queue.incremental else check(md, docx_path, converter.style, options)
+        if reason is None:
+            return {"status": "skipped", "reason": "已是最新", "seconds": time.monotonic() - started}
+        docx_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a file of our own first, so output is never half-written even if workers race
+        tmp = docx_path.with_name(f".{docx_path.name}.{queue.worker}.tmp")
+        try:
+            document = converter.convert(md, md_path, tmp)
+            os.replace(tmp, docx_path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        if queue.incremental:
+            Manifest._build(md, document, converter.style, options).save(docx_path)
+        return {"status": "rebuilt", "reason": reason, "seconds": time.monotonic() - started}
+    except Exception as e:
+        return {"status": "failed", "error": str(e), "seconds": time.monotonic() - started}
+
+
+def _build_key(style: Style, options: dict) -> str:
+    """Gets key of what outputs are built with, the same on every host"""
+    key = (RENDER_VERSION, style._key(), sorted(options.items()))
+    return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+
+
+def _item_id(item: Path) -> str:
+    """Gets filename-safe id for an item, the same on every host"""
+    return hashlib.sha1(item.as_posix().encode("utf-8")).hexdigest()
+
+
+class _Heartbeat:
+    """Renews claim on an item in the background while it's being converted"""
+
+    def __init__(self, queue: WorkQueue, item: Path) -> None:
+        self.queue = queue
+        self.item = item
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._beat, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop.set()
+        self.thread.join()
+        return False
+
+    def _beat(self):
+        while not self.stop.wait(self.queue.lease / 3):
+            self.queue.renew(self.item)
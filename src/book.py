@@ -0,0 +1,111 @@
+import docx
+from copy import copy
+from pathlib import Path
+from docx.oxml.ns import qn
+from .document import Document, _new_docx, _render_title, _write
+from .context import Context
+from .images import ImageStore
+from .limits import Budget, Limits
+from .events import Events
+from .styles import Style
+from .utils import _front_matter
+
+
+class Book:
+    """Many markdown chapters assembled into a single docx.
+
+    Chapters are parsed and rendered one at a time, so only a single chapter's elements are ever
+    held at once. They're rendered into one styled docx which shares images between chapters,
+    continues figure numbers and lets links go to headings in any chapter.
+
+    Only the book has a title page, so `title` and `subtitle` metadata in chapters is ignored and
+    chapters should start with their own `#` heading instead."""
+
+    def __init__(
+        self,
+        chapters: list[Path],
+        style: Style = Style.andy(),
+        title: str | None = None,
+        subtitle: str | None = None,
+        images: ImageStore | None = None,
+        limits: Limits | None = None,
+        listener=None,
+    ) -> None:
+        self.chapters = chapters  # markdown files in reading order
+        self.style = style
+        self.title = title
+        self.subtitle = subtitle
+        self.images = images if images is not None else ImageStore()
+        self.limits = limits  # limits for the whole book, not each chapter
+        self.listener = listener
+
+    @staticmethod
+    def load(path: Path, style: Style = Style.andy(), **kwargs) -> "Book":
+        """Gets book from a directory of chapters in filename order, or a manifest file listing
+        chapter paths one per line with optional `title` and `subtitle` metadata like markdown"""
+        if path.is_dir():
+            return Book(sorted(path.rglob("*.md")), style, **kwargs)
+
+        # Read manifest
+        with open(path, "r", encoding="utf-8") as file:
+            metadata, lines = _front_matter([line.strip() for line in file.read().splitlines()])
+        chapters = []
+        for line in lines:
+            # Skip empty lines and comments
+            if line == "" or line.startswith("#"):
+                continue
+            chapters.append(path.parent / line)
+        return Book(chapters, style, metadata.get("title"), metadata.get("subtitle"), **kwargs)
+
+    def save(self, path: Path, template: bytes | None = None, deterministic: bool = False):
+        """Saves book to `path` provided, optionally starting from a styled `template` made by `_template()`;
+        `deterministic` output is byte-identical every time for the same chapters"""
+        ctx = Context(None, self.images, Budget(self.limits), Events(self.listener))
+        docx_doc = _new_docx(self.style, template)
+        _render_title(docx_doc, ctx, self.title, self.subtitle)
+
+        # Add chapters
+        missing = []
+        for ind, chapter_path in enumerate(self.chapters):
+            # Chapters after the first start on a new page
+            if ind > 0:
+                docx_doc.add_page_break()
+            chapter = self._chapter(ctx, chapter_path)
+            chapter._render(docx_doc, title_page=False)
+            missing.extend(chapter.missing)
+            # Continue figure numbers in the next chapter
+            ctx.figures = chapter.ctx.figures
+            ctx.events.emit("chapter", index=ind + 1, total=len(self.chapters), path=chapter_path)
+
+        self._link_forward(docx_doc, ctx, missing)
+        with ctx.events.phase("write"):
+            _write(docx_doc, path, ctx, deterministic)
+
+    def _chapter(self, ctx: Context, path: Path) -> Document:
+        """Parses a single chapter, continuing on from the book's context"""
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                md = file.read()
+        except Exception as e:
+            raise Exception(f"章节 '{path}' 无效 ({e})")
+        # Images are found from each chapter's own directory
+        chapter_ctx = copy(ctx)
+        chapter_ctx.wd = path.parent
+        return Document(md, path, self.style, ctx=chapter_ctx)
+
+    def _link_forward(self, docx_doc: docx.Document, ctx: Context, missing: list[str]):
+        """Points links to headings in later chapters at their bookmarks, now every heading is known"""
+        found = set()
+        for anchor in missing:
+            if anchor in ctx.anchors:
+                found.add(anchor)
+            else:
+                print(f"链接锚点不存在: #{anchor}")
+        if not found:
+            return
+
+        # Links which weren't found were left going to their anchor as written
+        for hyperlink in docx_doc.element.body.iter(qn("w:hyperlink")):
+            anchor = hyperlink.get(qn("w:anchor"))
+            if anchor in found:
+                hyperlink.set(qn("w:anchor"), ctx.anchors[anchor])
@@ -1,25 +1,42 @@
 from pathlib import Path
 from .utils import _is_bib
+from .images import ImageStore
+from .limits import Budget
+from .events import Events
+
+
+class Section:
+    """Properties of the section under a heading, worked out once when the heading is parsed
+    rather than for every line within it"""
+
+    def __init__(self, title: str | None = None) -> None:
+        self.bib = title is not None and _is_bib(title)  # bibliography or references
+        self.no_spacing = self.bib  # elements have no spacing between them
+        self.page_break = self.bib  # starts on a new page
 
 
 class Context:
     """Contextual information for compartmentalised converting"""
 
-    def __init__(self, wd: Path | None = None) -> None:
+    def __init__(
+        self,
+        wd: Path | None = None,
+        images: ImageStore | None = None,
+        budget: Budget | None = None,
+        events: Events | None = None,
+    ) -> None:
         self.line = 0
-        self.heading = None
+        self.section = Section()  # section of the current heading
         self.italic = False
         self.bold = False
         self.underline = False
         self.strikethrough = False
         self.figures = 0
         self.wd = wd
-
-    def no_spacing(self) -> bool:
-        """Checks if elements should have spacing within the current section"""
-        if self.heading is None:
-            return False
-        return _is_bib(self.heading.text)
+        self.images = images if images is not None else ImageStore()  # shared between copies
+        self.budget = budget if budget is not None else Budget()  # shared between copies
+        self.events = events if events is not None else Events()  # shared between copies
+        self.anchors = {}  # heading anchor -> bookmark name, shared between copies
 
     def next_line(self):
         """Skips to the next line"""
@@ -0,0 +1,87 @@
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from .document import Document, _template
+from .images import ImageStore
+from .limits import Limits
+from .styles import Style
+
+
+class Converter:
+    """Reusable converter which shares resources between documents and threads.
+
+    Shared between every `convert()` call, all guarded by locks:
+    - an `ImageStore` with one http session and cached image bytes/dimensions; local images are
+      read again once their mtime or size changes, but remote ones are reused for up to
+      `ImageStore.remote_ttl` seconds (5 minutes by default), so changes on the server can take
+      that long to show up
+    - styled docx templates, built once per `Style`
+    - parsed documents, if `parse_cache` is more than 0 and there are no `limits` or listener
+
+    Everything else, such as the docx being written, parsing context, usage against `limits`
+    and the listener given events, belongs to a single call so any number of threads can convert at once. Cached
+    documents are shared between calls and must not be modified."""
+
+    def __init__(
+        self,
+        style: Style = Style.andy(),
+        images: ImageStore | None = None,
+        parse_cache: int = 0,
+        limits: Limits | None = None,
+        deterministic: bool = False,
+    ) -> None:
+        self.style = style  # default style for conversions
+        self.images = images if images is not None else ImageStore()
+        self.parse_cache = parse_cache  # number of parsed documents to keep
+        self.limits = limits  # limits for each conversion
+        self.deterministic = deterministic  # byte-identical output for identical inputs
+        self._lock = threading.Lock()
+        self._templates = {}  # style key -> template bytes
+        self._parsed = OrderedDict()  # (markdown hash, directory, style key) -> document
+
+    def parse(self, md: str, path: Path, style: Style | None = None, listener=None) -> Document:
+        """Parses markdown from a file at `path` into a document, reusing a cached parse if enabled"""
+        style = style if style is not None else self.style
+        # Limited or listened to documents have per-conversion state so can't be shared
+        if self.parse_cache <= 0 or self.limits is not None or listener is not None:
+            return Document(md, path, style, self.images, self.limits, listener)
+
+        # Images are resolved from the markdown's directory so that's part of the key too
+        key = (
+            hashlib.sha256(md.encode("utf-8")).hexdigest(),
+            str(path.parent.absolute()),
+            style._key(),
+        )
+        with self._lock:
+            if key in self._parsed:
+                self._parsed.move_to_end(key)
+                return self._parsed[key]
+        document = Document(md, path, style, self.images)
+        with self._lock:
+            self._parsed[key] = document
+            while len(self._parsed) > self.parse_cache:
+                self._parsed.popitem(last=False)
+        return document
+
+    def template(self, style: Style | None = None) -> bytes:
+        """Gets styled docx template for `style`, building it on first use"""
+        style = style if style is not None else self.style
+        key = style._key()
+        with self._lock:
+            template = self._templates.get(key)
+        if template is None:
+            # Built outside the lock, racing threads just build the same bytes twice
+            template = _template(style)
+            with self._lock:
+                template = self._templates.setdefault(key, template)
+        return template
+
+    def convert(
+        self, md: str, path: Path, docx_path: Path, style: Style | None = None, listener=None
+    ) -> Document:
+        """Converts markdown from a file at `path` and saves it to `docx_path`, giving conversion
+        events to `listener` if provided"""
+        document = self.parse(md, path, style, listener)
+        document.save(docx_path, self.template(document.style), self.deterministic)
+        return document
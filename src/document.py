@@ -1,14 +1,20 @@
-import re
+import os
 import docx
+import hashlib
+from io import BytesIO
 from copy import copy
-from .elements import Paragraph, Heading, Run, Codeblock, Quote, PointBullet, Image, Table, PointNumbered
+from .elements import Paragraph, Heading, Run, Codeblock, Quote, PointBullet, Image, Table, PointNumbered, References
 from .context import Context
+from .images import ImageStore
+from .limits import Budget, Limits, _LimitedWriter
+from .events import Events, _ProgressWriter
+from .reproducible import _save_reproducible
 from .styles import Style
 from pathlib import Path
 from docx.shared import Pt, RGBColor
 from docx.enum.style import WD_STYLE_TYPE
 from docx.enum.text import WD_BREAK
-from .utils import _style_title_border, _rm_toc
+from .utils import _style_title_border, _rm_toc, _front_matter, _match_image, _slug
 
 
 STYLE_CODE = "Code"
@@ -16,14 +22,38 @@ STYLE_CODE = "Code"
 class Document:
     """High-level document abstractions for conversion"""
 
-    def __init__(self, md: str, path: Path, style: Style = Style.andy()):
+    def __init__(
+        self,
+        md: str,
+        path: Path,
+        style: Style = Style.andy(),
+        images: ImageStore | None = None,
+        limits: Limits | None = None,
+        listener=None,
+        ctx: Context | None = None,
+    ):
         # Components
         self.elements = []
         self.title = None
         self.subtitle = None
-        self.ctx = Context(path.parent)
         self.style = style
+        if ctx is None:
+            self.ctx = Context(path.parent, images, Budget(limits), Events(listener))  # limits cover parsing and one save
+        else:
+            self.ctx = ctx  # chapters of a book continue on from the book's context
 
+        # Parse markdown into elements
+        with self.ctx.events.phase("parse"):
+            self._parse(md)
+            self.missing = self._index_anchors()  # internal links to headings not found
+
+        # Books check links once every chapter is parsed, as they can go to later chapters
+        if ctx is None:
+            for anchor in self.missing:
+                print(f"链接锚点不存在: #{anchor}")
+
+    def _parse(self, md: str):
+        """Parses markdown into this document's metadata and elements"""
         # Remove toc and clear up lines
         lines_raw = _rm_toc(md)
         lines = []
@@ -31,33 +61,14 @@ class Document:
             lines.append(line.rstrip())
 
         # Metadata
-        if len(lines) > 1 and lines[0] == "---":
-            # Go over lines in metadata
-            skip = 0
-            for ind, line in enumerate(lines[1:]):
-                # Stop metadata if it's ended
-                if line == "---":
-                    skip = ind + 1
-                    break
-                # Split at `:` token
-                splitted = line.split(":", 1)
-                # Go to next line if its invalid
-                if len(splitted) != 2:
-                    continue
-                # Clean left and right sections
-                left = splitted[0].lstrip().lower()
-                right = splitted[1].lstrip()
-                # Match left section
-                if left == "title":
-                    self.title = right
-                elif left == "subtitle":
-                    self.subtitle = right
-            # Skip to end of metadata if there was an open and close tag
-            if skip != 0:
-                lines = lines[1 + skip :]
+        metadata, lines = _front_matter(lines)
+        self.title = metadata.get("title")
+        self.subtitle = metadata.get("subtitle")
 
         # Parse through lines
         while self.ctx.line < len(lines):
+            self.ctx.budget.check_deadline()
+            counted = len(self.elements)
             # 获取当前行
             line = lines[self.ctx.line]
             stripped = line.lstrip()
@@ -70,10 +81,10 @@ class Document:
                 # 标题
                 heading = Heading._md(stripped)
                 self.elements.append(heading)
-                self.ctx.heading = heading
+                self.ctx.section = heading.section
             elif stripped.startswith("```"):
                 # 代块
-                codeblock, skip = Codeblock._md(lines[self.ctx.line :])
+                codeblock, skip = Codeblock._md(copy(self.ctx), lines, self.ctx.line)
                 self.ctx.line += skip
                 self.elements.append(codeblock)
             elif stripped.startswith(">"):
@@ -82,15 +93,12 @@ class Document:
             elif stripped.startswith("-"):
                 # 无序列表
                 self.elements.append(PointBullet._md(copy(self.ctx), line))
-            elif match := re.search(
-                r"^!\[.*\]\(.+\)",
-                line,
-            ):
+            elif matched := _match_image(line):
                 # 图片
-                self.elements.append(Image._md(self.ctx, match.group(0)))
+                self.elements.append(Image._md(self.ctx, matched))
             elif stripped.startswith("|") or stripped.startswith("+-"):
                 # 表格
-                table, skip = Table._md(lines[self.ctx.line:])
+                table, skip = Table._md(copy(self.ctx), lines, self.ctx.line)
                 self.ctx.line += skip
                 self.elements.append(table)
             # Check others
@@ -103,17 +111,18 @@ class Document:
                     self.elements.append(PointNumbered._md(copy(self.ctx), line))
                 # Paragraph
                 except:
+                    section = self.ctx.section
                     if (
                         # Non-sensitive typical empty lines
-                        (not self.ctx.no_spacing() and line == "")
+                        (not section.no_spacing and line == "")
                         # Sensitive but last line was title
                         or (
-                            self.ctx.no_spacing()
+                            section.no_spacing
                             and lines[self.ctx.line - 1].lstrip().startswith("#")
                         )
                         # Sensitive but next line is title
                         or (
-                            self.ctx.no_spacing()
+                            section.no_spacing
                             and len(lines) > self.ctx.line + 1
                             and lines[self.ctx.line + 1].lstrip().startswith("#")
                         )
@@ -121,108 +130,248 @@ class Document:
                         # Skip empty line
                         self.ctx.next_line()
                         continue
-                    self.elements.append(Paragraph._md(copy(self.ctx), stripped))
+                    paragraph = Paragraph._md(copy(self.ctx), stripped)
+                    # Bibliography entries go in one block, carried on until something else comes up
+                    if section.bib and self.elements and isinstance(self.elements[-1], References):
+                        self.elements[-1].entries.append(paragraph)
+                        self.ctx.budget.add_elements(1)
+                    elif section.bib:
+                        self.elements.append(References([paragraph]))
+                    else:
+                        self.elements.append(paragraph)
+
+            # Count new element against limits
+            if len(self.elements) > counted:
+                self.ctx.budget.add_elements(_element_size(self.elements[-1]))
 
             # Move to next line
             self.ctx.next_line()
 
-    def save(self, path: Path):
-        """Saves document to `path` provided"""
-        # Create docx file
-        docx_doc = docx.Document()
-
-        # New styles
-        style_codeblock = docx_doc.styles.add_style(STYLE_CODE, WD_STYLE_TYPE.PARAGRAPH)
-
-        # Add title/subtitle
-        if self.title or self.subtitle:
-            # Create empty lines before title
-            for _ in range(4):
-                para = Paragraph(copy(self.ctx), [Run(copy(self.ctx), "")])
-                para._docx(docx_doc)
-
-            # Add title
-            if self.title:
-                docx_para = docx_doc.add_heading(self.title, 0)
-            # Add subtitle
-            if self.subtitle:
-                docx_para = Paragraph(
-                    copy(self.ctx), [Run(copy(self.ctx), self.subtitle)]
-                )._docx(docx_doc)
-                docx_para.style = "Subtitle"
-
-            # Page break
-            docx_para = docx_doc.add_paragraph()
-            docx_run = docx_para.add_run()
-            docx_run.add_break(WD_BREAK.PAGE)
+    def _index_anchors(self) -> list[str]:
+        """Gives headings bookmarks and finds internal links which don't go to one, in a single pass"""
+        internal = []
+        for element in self.elements:
+            # Headings get anchors like `#some-heading`, numbered if repeated like `#some-heading-1`
+            if isinstance(element, Heading):
+                base = _slug(element.text)
+                anchor = base
+                repeats = 0
+                while anchor in self.ctx.anchors:
+                    repeats += 1
+                    anchor = f"{base}-{repeats}"
+                bookmark_id = len(self.ctx.anchors)
+                element.bookmark = (bookmark_id, f"_Heading{bookmark_id}")
+                self.ctx.anchors[anchor] = element.bookmark[1]
+            # Internal links to check once every heading is known
+            for run in getattr(element, "runs", []):
+                if run.link and not run.link[1]:
+                    internal.append(run.link[0])
 
-        # Add elements
+        # Check links
+        return [anchor for anchor in internal if anchor not in self.ctx.anchors]
+
+    def local_images(self) -> list[Path]:
+        """Gets every local image this document links to, resolved from the markdown file's directory;
+        inline images which don't exist are included as well, so they can be noticed once they do"""
+        images = []
         for element in self.elements:
-            element._docx(docx_doc)
-
-        # Replace all fonts with body font by default
-        for style in docx_doc.styles:
-            if hasattr(style, "font"):
-                style.font.name = self.style.font_body
-
-        # Styling for title
-        style_title = docx_doc.styles["Title"]
-        _style_title_border(style_title)
-        style_title.font.name = self.style.font_heading
-        style_title.font.size = Pt(26)
-        if not self.style.heading_blue:
-            style_title.font.color.rgb = RGBColor(0x00, 0x00, 0x00)
-        style_title.paragraph_format.space_after = Pt(3)
-        style_title.paragraph_format.alignment = 1
-
-        # Styling for subtitle
-        style_subtitle = docx_doc.styles["Subtitle"]
-        style_subtitle.font.name = self.style.font_heading
-        style_subtitle.font.size = Pt(14)
-        if not self.style.heading_blue:
-            style_subtitle.font.color.rgb = RGBColor(0x00, 0x00, 0x00)
-        style_subtitle.font.italic = False
-        style_subtitle.paragraph_format.alignment = 1
-
-        # Styling for headings
-        for h in range(1, 9):
-            style_heading = docx_doc.styles[f"Heading {h}"]
-            style_heading.font.name = self.style.font_heading
-            style_heading.font.bold = self.style.heading_bold
-            if not self.style.heading_blue:
-                style_heading.font.color.rgb = RGBColor(0x00, 0x00, 0x00)
-
-            # Per-level styling
-            if h == 1:
-                style_heading.font.size = Pt(22)
-                style_heading.paragraph_format.space_after = Pt(2)
-            elif h == 2:
-                style_heading.font.size = Pt(17)
-            elif h <= 4:
-                style_heading.font.size = Pt(13)
-            # Italics for small headings
-            if h > 3:
-                style_heading.font.italic = True
-
-        # Styling for paragraphs
-        style_paragraph = docx_doc.styles["Normal"]
-        style_paragraph.font.size = Pt(self.style.body_pt)
-        style_paragraph.paragraph_format.alignment = self.style._body_alignment()
-        style_paragraph.paragraph_format.line_spacing = self.style.body_lines
-
-        # Styling for captions
-        if not self.style.heading_blue:
-            style_caption = docx_doc.styles["Caption"]
-            style_caption.font.color.rgb = RGBColor(0x00, 0x00, 0x00)
-
-        # Styling for codeblocks
-        style_codeblock.font.name = self.style.font_code
-        style_codeblock.paragraph_format.space_after = Pt(0)
-        style_codeblock.paragraph_format.line_spacing = 1
-        style_codeblock.paragraph_format.alignment = 0
-
-        # TODO: new "Link" run styling, can be done
-
-        # Use docx's vanilla save
-        docx_doc.save(path)
+            # Standalone images
+            if isinstance(element, Image):
+                images.append(element.link)
+            # Inline images within runs
+            for run in getattr(element, "runs", []):
+                if run.image and not run.image[0].startswith(("http://", "https://")):
+                    images.append(run.ctx.link_to(run.image[0]))
+        return images
+
+    def save(self, path: Path, template: bytes | None = None, deterministic: bool = False):
+        """Saves document to `path` provided, optionally starting from a styled `template` made by `_template()`;
+        `deterministic` output is byte-identical every time for the same document"""
+        docx_doc = _new_docx(self.style, template)
+        self._render(docx_doc)
+        with self.ctx.events.phase("write"):
+            _write(docx_doc, path, self.ctx, deterministic)
+
+    def _render(self, docx_doc: docx.Document, title_page: bool = True):
+        """Adds title page, unless it's left out for chapters of a book, and elements to the end of a docx"""
+        if title_page:
+            _render_title(docx_doc, self.ctx, self.title, self.subtitle)
+
+        # Add elements
+        events = self.ctx.events
+        with events.phase("render"):
+            for ind, element in enumerate(self.elements):
+                self.ctx.budget.check_deadline()
+                element._docx(docx_doc)
+                if events.listener is not None:
+                    events.emit(
+                        "element",
+                        index=ind + 1,
+                        total=len(self.elements),
+                        element=type(element).__name__,
+                    )
+
+
+def _new_docx(style: Style, template: bytes | None = None) -> docx.Document:
+    """Creates styled docx to render into, from a `template` made by `_template()` if provided"""
+    if template is None:
+        template = _prebuilt(style)
+    if template is not None:
+        return docx.Document(BytesIO(template))
+    return _styled_docx(style)
+
+
+def _render_title(docx_doc: docx.Document, ctx: Context, title: str | None, subtitle: str | None):
+    """Adds title page with an optional title and subtitle, if there's either"""
+    if not title and not subtitle:
+        return
+
+    # Create empty lines before title
+    for _ in range(4):
+        para = Paragraph(copy(ctx), [Run(copy(ctx), "")])
+        para._docx(docx_doc)
+
+    # Add title
+    if title:
+        docx_para = docx_doc.add_heading(title, 0)
+    # Add subtitle
+    if subtitle:
+        docx_para = Paragraph(copy(ctx), [Run(copy(ctx), subtitle)])._docx(docx_doc)
+        docx_para.style = "Subtitle"
+
+    # Page break
+    docx_para = docx_doc.add_paragraph()
+    docx_run = docx_para.add_run()
+    docx_run.add_break(WD_BREAK.PAGE)
+
+
+def _write(docx_doc: docx.Document, path: Path, ctx: Context, deterministic: bool = False):
+    """Writes finished docx to `path`, stopping as soon as it's too big if its size is limited"""
+    events = ctx.events
+    limited = ctx.budget.limits.max_output_bytes is not None
+    save = docx_doc.save if not deterministic else lambda file: _save_reproducible(docx_doc, file)
+    # Use docx's vanilla save
+    if not limited and events.listener is None:
+        save(path)
+        return
+
+    # Limited output goes to a temporary file which only replaces `path` once it's all fitted
+    out = path.with_name(f".{path.name}.tmp") if limited else path
+    try:
+        with open(out, "wb") as file:
+            writer = _LimitedWriter(file, ctx.budget) if limited else file
+            save(writer if events.listener is None else _ProgressWriter(writer, events))
+            size = file.tell()
+    except BaseException:
+        if limited:
+            out.unlink(missing_ok=True)
+        raise
+    if limited:
+        os.replace(out, path)
+    events.emit("write", bytes=size)
+
+
+def _element_size(element) -> int:
+    """Gets how many elements something counts as for limits, as codeblocks and tables can be huge"""
+    if isinstance(element, Codeblock):
+        return len(element.lines) + 1
+    if isinstance(element, Table):
+        return sum(len(row) for row in element.rows) + 1
+    return 1
+
+
+def _template(style: Style) -> bytes:
+    """Creates an empty docx with `style` applied, as bytes which can be reused for many documents"""
+    prebuilt = _prebuilt(style)
+    if prebuilt is not None:
+        return prebuilt
+    buf = BytesIO()
+    _styled_docx(style).save(buf)
+    return buf.getvalue()
+
+
+def _template_name(style: Style) -> str:
+    """Gets filename of a template embedded for `style` by `build.py`"""
+    return hashlib.sha1(repr(style._key()).encode("utf-8")).hexdigest()[:16] + ".docx"
+
+
+def _prebuilt(style: Style) -> bytes | None:
+    """Gets template embedded for `style` by `build.py`, which is also the only way to get one
+    inside a zipapp as python-docx opens its default template from the filesystem"""
+    try:
+        return __loader__.get_data(str(Path(__file__).parent / "templates" / _template_name(style)))
+    except OSError:
+        return None
+
+
+def _styled_docx(style: Style) -> docx.Document:
+    """Creates an empty docx with `style` applied"""
+    # Create docx file
+    docx_doc = docx.Document()
+
+    # New styles
+    style_codeblock = docx_doc.styles.add_style(STYLE_CODE, WD_STYLE_TYPE.PARAGRAPH)
+
+    # Replace all fonts with body font by default
+    for docx_style in docx_doc.styles:
+        if hasattr(docx_style, "font"):
+            docx_style.font.name = style.font_body
+
+    # Styling for title
+    style_title = docx_doc.styles["Title"]
+    _style_title_border(style_title)
+    style_title.font.name = style.font_heading
+    style_title.font.size = Pt(26)
+    if not style.heading_blue:
+        style_title.font.color.rgb = RGBColor(0x00, 0x00, 0x00)
+    style_title.paragraph_format.space_after = Pt(3)
+    style_title.paragraph_format.alignment = 1
+
+    # Styling for subtitle
+    style_subtitle = docx_doc.styles["Subtitle"]
+    style_subtitle.font.name = style.font_heading
+    style_subtitle.font.size = Pt(14)
+    if not style.heading_blue:
+        style_subtitle.font.color.rgb = RGBColor(0x00, 0x00, 0x00)
+    style_subtitle.font.italic = False
+    style_subtitle.paragraph_format.alignment = 1
+
+    # Styling for headings
+    for h in range(1, 9):
+        style_heading = docx_doc.styles[f"Heading {h}"]
+        style_heading.font.name = style.font_heading
+        style_heading.font.bold = style.heading_bold
+        if not style.heading_blue:
+            style_heading.font.color.rgb = RGBColor(0x00, 0x00, 0x00)
+
+        # Per-level styling
+        if h == 1:
+            style_heading.font.size = Pt(22)
+            style_heading.paragraph_format.space_after = Pt(2)
+        elif h == 2:
+            style_heading.font.size = Pt(17)
+        elif h <= 4:
+            style_heading.font.size = Pt(13)
+        # Italics for small headings
+        if h > 3:
+            style_heading.font.italic = True
+
+    # Styling for paragraphs
+    style_paragraph = docx_doc.styles["Normal"]
+    style_paragraph.font.size = Pt(style.body_pt)
+    style_paragraph.paragraph_format.alignment = style._body_alignment()
+    style_paragraph.paragraph_format.line_spacing = style.body_lines
+
+    # Styling for captions
+    if not style.heading_blue:
+        style_caption = docx_doc.styles["Caption"]
+        style_caption.font.color.rgb = RGBColor(0x00, 0x00, 0x00)
+
+    # Styling for codeblocks
+    style_codeblock.font.name = style.font_code
+    style_codeblock.paragraph_format.space_after = Pt(0)
+    style_codeblock.paragraph_format.line_spacing = 1
+    style_codeblock.paragraph_format.alignment = 0
 
+    # TODO: new "Link" run styling, can be done
+    return docx_doc
@@ -1,17 +1,19 @@
 import re
+import time
 import docx
-import requests
-import PIL.Image
 from io import BytesIO
 from docx.shared import Cm
 from docx.enum.table import WD_TABLE_ALIGNMENT
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
-from .context import Context
-from .utils import _add_link, _is_bib, _level_info
-from copy import copy
+from pathlib import Path
+from .context import Context, Section
+from .limits import LimitExceeded
+from .utils import _add_link, _bookmark, _level_info, _per_part, _Numbering, _Prototypes
+from copy import copy, deepcopy
 
 STYLE_CODE = "Code"
+_SPECIAL = re.compile(r"[\\*<\[!]")  # characters which can start formatting, links or images in a paragraph
 
 class Heading:
     """Heading section inside document"""
@@ -19,25 +21,29 @@ class Heading:
     def __init__(self, text: str, level: int) -> None:
         self.text = text
         self.level = level
+        self.section = Section(text)  # properties of the section this heading starts
+        self.bookmark = None  # (id, name) for internal links to go to
 
     def _md(line: str):
         # Parse number of # for level
         level = 0
-        while line[level] == "#":
+        while level < len(line) and line[level] == "#":
             level += 1
         # Get and clean text
         text = line[level:].lstrip()
         return Heading(text, level)
 
     def _docx(self, docx_doc: docx.Document):
-        # Page break for bibliography
-        if _is_bib(self.text):
+        # Page break for sections like bibliographies
+        if self.section.page_break:
             docx_doc.add_page_break()
-        # Add heading
-        docx_para = docx_doc.add_heading(self.text, self.level)
-        # TODO: bookmarks
-        # print(docx_para._element.xml)
-        # docx_para.insert(0, etree.XML("<hi />"))
+        # Add heading, like `add_heading()` but without looking its style up every time
+        prototypes = _per_part(docx_doc.part, _Prototypes)
+        docx_para = prototypes.paragraph(docx_doc, f"Heading {self.level}")
+        prototypes.run(docx_para, self.text, (False, False, False, False))
+        # Bookmark for internal links
+        if self.bookmark:
+            _bookmark(docx_para, *self.bookmark)
 
 
 
@@ -54,6 +60,14 @@ class Run:
         self.link = link
         self.image = image
 
+    def _plain(self) -> bool:
+        """Checks if this run is plain styled text rather than a link or image"""
+        return self.link is None and self.image is None
+
+    def _formatting(self) -> tuple:
+        """Gets formatting of this run for comparison with others"""
+        return (self.ctx.bold, self.ctx.italic, self.ctx.underline, self.ctx.strikethrough)
+
     def _docx(self, docx_para):
         if self.image:
             url, alt_text, title = self.image
@@ -62,16 +76,29 @@ class Run:
             # 尝试获取图片数据
             if url.startswith(('http://', 'https://')):
                 try:
-                    response = requests.get(url, timeout=10)
-                    response.raise_for_status()
-                    img_data = BytesIO(response.content)
+                    img_data = _get_image(self.ctx, url)
+                except LimitExceeded as e:
+                    if not self.ctx.budget.degrades(e):
+                        raise
+                    print(f"跳过图片 {url}: {e}")
+                    docx_para.add_run(f"[图片: {url} 超出限制]")
+                    return
                 except Exception as e:
                     print(f"无法下载图片 {url}: {e}")
                     docx_para.add_run(f"[图片: {url} 下载失败]")
             else:
                 img_path = self.ctx.link_to(url)
                 if img_path.exists():
-                    img_data = str(img_path)
+                    try:
+                        img_data = _get_image(self.ctx, img_path)
+                    except LimitExceeded as e:
+                        if not self.ctx.budget.degrades(e):
+                            raise
+                        print(f"跳过图片 {url}: {e}")
+                        docx_para.add_run(f"[图片: {url} 超出限制]")
+                        return
+                    except Exception as e:
+                        print(f"无法读取图片 {url}: {e}")
                 else:
                     print(f"图片文件不存在: {url}")
                     docx_para.add_run(f"[图片: {url} 文件不存在]")
@@ -79,20 +106,18 @@ class Run:
             if img_data:
                 try:
                     # 获取图片尺寸
-                    img = PIL.Image.open(img_data if isinstance(img_data, BytesIO) else img_data)
-                    width, height = img.size
-                    
+                    data, (width, height) = img_data
+
                     # 插入图片
                     if height > width:
-                        docx_para.add_run().add_picture(img_data, height=Cm(10))
+                        docx_para.add_run().add_picture(BytesIO(data), height=Cm(10))
                     else:
-                        docx_para.add_run().add_picture(img_data, width=Cm(12))
-                    
+                        docx_para.add_run().add_picture(BytesIO(data), width=Cm(12))
+
                     # 如果有标题,添加图片说明
                     if title:
                         docx_para.add_run().add_break()
                         docx_para.add_run(f"图 {self.ctx.figures} - {title}")
-                        self.ctx.figures += 1
                 except Exception as e:
                     print(f"无法插入图片 {url}: {e}")
                     docx_para.add_run(f"[图片: {url}]")
@@ -101,20 +126,13 @@ class Run:
                 docx_para.add_run(f"[图片: {url}]")
         elif self.link:
             link, external = self.link
+            # Go to heading's bookmark for internal links
+            if not external:
+                link = self.ctx.anchors.get(link, link)
             return _add_link(docx_para, link, self.text, external)
         else:
-            # Add plain run text
-            docx_run = docx_para.add_run(self.text)
-            # Add relevant styles
-            if self.ctx.bold:
-                docx_run.bold = True
-            if self.ctx.italic:
-                docx_run.italic = True
-            if self.ctx.underline:
-                docx_run.underline = True
-            if self.ctx.strikethrough:
-                docx_run.strikethrough = True
-            return docx_run
+            # Add plain run text with relevant styles
+            return _per_part(docx_para.part, _Prototypes).run(docx_para, self.text, self._formatting())
 
 
 class Paragraph:
@@ -134,13 +152,15 @@ class Paragraph:
         runs = []
         ind = 0
         flipflop = False
-        buf = ""
+        buf = []  # characters, joined when flushed so long runs stay linear
+        links = _LinkScanner(line)
+        closers = _Finder(line, ">")
 
         # Go through each character
         while ind < len(line):
             # Flipflops
             if flipflop:
-                buf += line[ind]
+                buf.append(line[ind])
                 ind += 1
                 flipflop = False
             # Backslash for flipflop
@@ -149,38 +169,30 @@ class Paragraph:
             # Bold/italics
             elif line[ind] == "*":
                 # Clear buf
-                runs.append(Run(ctx, buf))
-                buf = ""
+                runs.append(Run(ctx, "".join(buf)))
+                buf = []
                 # Parse
-                ind += _run_ib(ctx, line[ind:])
+                ind += _run_ib(ctx, line, ind)
             # Cheeky link
-            elif line[ind] == "<" and ">" in line[ind:]:
+            elif line[ind] == "<" and closers.next(ind) != -1:
                 # Clear buf
-                runs.append(Run(ctx, buf))
-                buf = ""
+                runs.append(Run(ctx, "".join(buf)))
+                buf = []
                 # Parse
-                res = _run_cheeky(ctx, line[ind:])
+                res = _run_cheeky(ctx, line, ind)
                 ind += res[0]
                 runs.append(res[1])
             # Misc
             else:
                 # Find instances of link or image
-                match = re.search(
-                    r"^(!?)\[(.+?)\]\((.+?)(\s+\"(.+?)\")?\)",
-                    line[ind:],
-                )
+                match = links.match(ind)
 
                 # Link or Image
                 if match:
                     # Finish existing buffer and skip link/image
-                    runs.append(Run(ctx, buf))
-                    buf = ""
-                    ind += len(match.group(0))
-                    
-                    is_image = bool(match.group(1))
-                    text = match.group(2)
-                    link = match.group(3)
-                    title = match.group(5)
+                    runs.append(Run(ctx, "".join(buf)))
+                    buf = []
+                    ind, is_image, text, link, title = match
 
                     if is_image:
                         # Image
@@ -194,50 +206,85 @@ class Paragraph:
                             # External link
                             runs.append(Run(ctx, text, link=(link, True)))
 
-                # Normal character
+                # Normal characters, up to the next one which could start something else
                 else:
-                    buf += line[ind]
-                    ind += 1
+                    end = _SPECIAL.search(line, ind + 1)
+                    end = end.start() if end else len(line)
+                    buf.append(line[ind:end])
+                    ind = end
 
         # Create paragraph and return
-        runs.append(Run(ctx, buf))
-        return Paragraph(ctx, runs)
+        runs.append(Run(ctx, "".join(buf)))
+        return Paragraph(ctx, _coalesce_runs(runs))
 
-    def _docx(self, docx_doc: docx.Document) -> docx.text.paragraph.Paragraph:
-        # Add empty paragraph
-        docx_para = docx_doc.add_paragraph()
+    def _style(self) -> str | None:
+        """Gets name of the style this paragraph is rendered with"""
         # Make no-spaced if defined
-        if self.ctx.no_spacing():
-            docx_para.style = "No Spacing"
+        if self.ctx.section.no_spacing:
+            return "No Spacing"
+        return None
+
+    def _new(self, docx_doc: docx.Document) -> docx.text.paragraph.Paragraph:
+        """Adds empty paragraph which this paragraph's runs go in"""
+        return _per_part(docx_doc.part, _Prototypes).paragraph(docx_doc, self._style())
+
+    def _docx(self, docx_doc: docx.Document) -> docx.text.paragraph.Paragraph:
+        # Add empty styled paragraph
+        docx_para = self._new(docx_doc)
         # Add runs to paragraph
         for run in self.runs:
             run._docx(docx_para)
         return docx_para
 
 
+class References:
+    """Entries of a bibliography section grouped into one block, so bibliographies with many
+    thousands of entries are rendered with as little work for each entry as possible"""
+
+    def __init__(self, entries: list) -> None:
+        self.entries = entries  # paragraphs, including empty ones as they're kept in bibliographies
+
+    @property
+    def runs(self):
+        """Runs of every entry, for finding links and images like in other elements"""
+        for entry in self.entries:
+            yield from entry.runs
+
+    def _docx(self, docx_doc: docx.Document):
+        # Entries share a style so look its prototype up once
+        prototypes = _per_part(docx_doc.part, _Prototypes)
+        style = self.entries[0]._style()
+        for entry in self.entries:
+            docx_para = prototypes.paragraph(docx_doc, style)
+            for run in entry.runs:
+                run._docx(docx_para)
+
+
 class Codeblock:
     """Codeblock containing language and monospaced code"""
 
-    def __init__(self, lines: list, lang: str = None, heading_after: bool = False):
+    def __init__(self, ctx: Context, lines: list, lang: str = None, heading_after: bool = False):
+        self.ctx = ctx
         self.lines = lines
         self.lang = lang  # TODO: use somewhere in docx
         self.heading_after = heading_after
 
     @staticmethod
-    def _md(lines: list) -> tuple:
+    def _md(ctx: Context, lines: list, start: int = 0) -> tuple:
         # Get language after ``` designator
         lang = (
-            lines[0].lstrip()[3:].lstrip()
+            lines[start].lstrip()[3:].lstrip()
         )  # first `lstrip()` used in document parsing
         lang = lang if lang != "" else None
 
         # Read lines
         heading_after = False
         code = []
-        for ind, line in enumerate(lines[1:]):
+        for ind in range(start + 1, len(lines)):
+            line = lines[ind]
             if line.lstrip() == "```":
                 # Check if there's a heading afterwards
-                if len(lines[1:]) - 1 > ind and lines[ind + 2].lstrip().startswith("#"):
+                if ind + 1 < len(lines) and lines[ind + 1].lstrip().startswith("#"):
                     heading_after = True
                 # Stop codeblock
                 break
@@ -246,28 +293,28 @@ class Codeblock:
 
         # Get skip
         skip = len(code) + 1
-        return (Codeblock(code, lang, heading_after), skip)
+        return (Codeblock(ctx, code, lang, heading_after), skip)
 
     def _docx(self, docx_doc: docx.Document):
         # Calculate justification for lines
         just = len(str(len(self.lines)))
+        prototypes = _per_part(docx_doc.part, _Prototypes)
         # Add lines
         for ind, line in enumerate(self.lines):
+            # Huge codeblocks can take long enough to go past the deadline by themselves
+            self.ctx.budget.check_deadline()
             # Figure out line number
             num = str(ind + 1).rjust(just)
             # Add new paragraph with code style
-            docx_para = docx_doc.add_paragraph()
-            docx_para.style = STYLE_CODE
+            docx_para = prototypes.paragraph(docx_doc, STYLE_CODE)
             # Add line number with italics
-            docx_run = docx_para.add_run(num)
-            docx_run.font.italic = True
+            prototypes.run(docx_para, num, (False, True, False, False))
             # Add actual code
-            docx_para.add_run(" " + line)
+            prototypes.run(docx_para, " " + line, (False, False, False, False))
 
         # Add small codeblock line for formatting if there's not a heading afterwards
         if not self.heading_after:
-            docx_para = docx_doc.add_paragraph()
-            docx_para.style = STYLE_CODE
+            prototypes.paragraph(docx_doc, STYLE_CODE)
 
 
 class Quote(Paragraph):
@@ -288,15 +335,17 @@ class Quote(Paragraph):
         quote.level = level
         return quote
 
-    def _docx(self, docx_doc: docx.Document) -> docx.text.paragraph.Paragraph:
-        # Get inherited generated paragraph
-        para = super()._docx(docx_doc)
-        # Reset to quote styling
-        para.style = "Quote"
+    def _style(self) -> str | None:
+        return "Quote"
+
+    def _new(self, docx_doc: docx.Document) -> docx.text.paragraph.Paragraph:
+        # Indents only depend on level, so each level gets its own prototype
+        return _per_part(docx_doc.part, _Prototypes).paragraph(docx_doc, self._style(), self._indent, self.level)
+
+    def _indent(self, para: docx.text.paragraph.Paragraph):
         INDENT = 0.75
         para.paragraph_format.left_indent = Cm(INDENT * self.level + 1)
         para.paragraph_format.right_indent = Cm(INDENT)
-        return para
 
 
 class PointBullet(Paragraph):
@@ -317,14 +366,15 @@ class PointBullet(Paragraph):
         bullet.level = level
         return bullet
 
-    def _docx(self, docx_doc: docx.Document) -> docx.text.paragraph.Paragraph:
-        # Get inherited generated paragraph
-        docx_para = super()._docx(docx_doc)
+    def _style(self) -> str | None:
         # Set bullet style according to level
-        docx_para.style = (
-            "List Bullet" if self.level == 0 else f"List Bullet {self.level+1}"
-        )
-        return docx_para
+        return "List Bullet" if self.level == 0 else f"List Bullet {self.level+1}"
+
+    def _new(self, docx_doc: docx.Document) -> docx.text.paragraph.Paragraph:
+        para = super()._new(docx_doc)
+        # Bullets end numbered lists at the same level
+        _per_part(docx_doc.part, _Numbering).item(para, self._style(), self.level)
+        return para
 
 
 class PointNumbered(Paragraph):
@@ -348,15 +398,16 @@ class PointNumbered(Paragraph):
         numbered.num = num
         return numbered
 
-    def _docx(self, docx_doc: docx.Document) -> docx.text.paragraph.Paragraph:
-        # TODO: use something like "start at self.num" so markdown starting at like `20.` can be used, it fucks up otherwise
-        # Get inherited generated paragraph
-        docx_para = super()._docx(docx_doc)
+    def _style(self) -> str | None:
         # Set bullet style according to level
-        docx_para.style = (
-            "List Number" if self.level == 0 else f"List Number {self.level+1}"
-        )
-        return docx_para
+        return "List Number" if self.level == 0 else f"List Number {self.level+1}"
+
+    def _new(self, docx_doc: docx.Document) -> docx.text.paragraph.Paragraph:
+        prototypes = _per_part(docx_doc.part, _Prototypes)
+        para = prototypes.paragraph(docx_doc, self._style(), _Numbering._numbered, "numbered")
+        # Continue list or restart it from the number markdown starts at
+        _per_part(docx_doc.part, _Numbering).item(para, self._style(), self.level, self.num)
+        return para
 
 
 class Image:
@@ -387,9 +438,14 @@ class Image:
         return Image(copy(ctx), link, caption)
 
     def _docx(self, docx_doc: docx.Document) -> list[docx.text.paragraph.Paragraph]:
-        # Get image width/heigth
-        img = PIL.Image.open(self.link)
-        width, height = (img.width, img.height)
+        # Get image bytes and width/heigth, using placeholder if it's too big
+        try:
+            data, (width, height) = _get_image(self.ctx, self.link)
+        except LimitExceeded as e:
+            if not self.ctx.budget.degrades(e):
+                raise
+            print(f"跳过图片 {self.link}: {e}")
+            return [docx_doc.add_paragraph(f"[图片: {self.link.name} 超出限制]")]
 
         # Insert image
         docx_para_image = docx_doc.add_paragraph()
@@ -397,9 +453,9 @@ class Image:
         try:
             # Width/height adjustment so it won't fall off the page
             if height > width:
-                docx_run.add_picture(self.safe_link, height=Cm(10))
+                docx_run.add_picture(BytesIO(data), height=Cm(10))
             else:
-                docx_run.add_picture(self.safe_link, width=Cm(12))
+                docx_run.add_picture(BytesIO(data), width=Cm(12))
         except Exception as e:
             raise Exception(f"Failed to add image {self.link} to document ({e})")
 
@@ -413,14 +469,16 @@ class Image:
 
 
 class Table:
-    def __init__(self, rows):
+    def __init__(self, ctx: Context, rows):
+        self.ctx = ctx
         self.rows = rows
 
     @staticmethod
-    def _md(lines):
+    def _md(ctx: Context, lines, start=0):
         rows = []
         skip = 0
-        for line in lines:
+        for ind in range(start, len(lines)):
+            line = lines[ind]
             if not line.strip().startswith("|"):
                 break
             cells = [cell.strip() for cell in line.split("|")[1:-1]]
@@ -429,49 +487,175 @@ class Table:
                 continue
             rows.append(cells)
             skip += 1
-        return Table(rows), skip
+        return Table(ctx, rows), skip
 
     def _docx(self, docx_doc):
-        table = docx_doc.add_table(rows=len(self.rows), cols=len(self.rows[0]))
+        # Copy the first row for the rest, as python-docx builds all rows' xml in one growing string
+        table = docx_doc.add_table(rows=1, cols=len(self.rows[0]))
+        tr = table._tbl.tr_lst[0]
+        for _ in range(len(self.rows) - 1):
+            table._tbl.append(deepcopy(tr))
         table.style = 'Table Grid'
         table.alignment = WD_TABLE_ALIGNMENT.CENTER
-        
-        for i, row in enumerate(self.rows):
-            for j, cell in enumerate(row):
-                table.cell(i, j).text = cell
-        
+
+        # Fill cells a row at a time, as `table.cell()` works out the whole grid on every call
+        for tr, row in zip(table._tbl.tr_lst, self.rows):
+            self.ctx.budget.check_deadline()
+            for tc, cell in zip(tr.tc_lst, row):
+                docx.table._Cell(tc, table).text = cell
+
         # 设置单元格边框
         self.set_cell_border(table)
 
-    @staticmethod
-    def set_cell_border(table):
+    def set_cell_border(self, table):
         tbl = table._tbl
-        for cell in tbl.iter_tcs():
-            tcPr = cell.get_or_add_tcPr()
-            tcBorders = OxmlElement('w:tcBorders')
-            for border in ['top', 'left', 'bottom', 'right']:
-                edge = OxmlElement(f'w:{border}')
-                edge.set(qn('w:val'), 'single')
-                edge.set(qn('w:sz'), '4')
-                edge.set(qn('w:space'), '0')
-                edge.set(qn('w:color'), 'auto')
-                tcBorders.append(edge)
-            tcPr.append(tcBorders)
-
-
-def _run_cheeky(ctx: Context, line: str) -> tuple:
-    """Run parsing for cheeky links (the <> links)"""
+        for tr in tbl.tr_lst:
+            self.ctx.budget.check_deadline()
+            for cell in tr.tc_lst:
+                tcPr = cell.get_or_add_tcPr()
+                tcBorders = OxmlElement('w:tcBorders')
+                for border in ['top', 'left', 'bottom', 'right']:
+                    edge = OxmlElement(f'w:{border}')
+                    edge.set(qn('w:val'), 'single')
+                    edge.set(qn('w:sz'), '4')
+                    edge.set(qn('w:space'), '0')
+                    edge.set(qn('w:color'), 'auto')
+                    tcBorders.append(edge)
+                tcPr.append(tcBorders)
+
+
+def _get_image(ctx: Context, source: str | Path) -> tuple:
+    """Gets bytes and dimensions of an image from a url or local path within limits,
+    reporting how the fetch went to listeners"""
+    if isinstance(source, str):
+        get = lambda: ctx.budget.remote(ctx.images, source)
+    else:
+        get = lambda: ctx.budget.local(ctx.images, source)
+    if ctx.events.listener is None:
+        return get()
+
+    # Time fetch for listeners
+    ctx.events.emit("image_start", source=str(source))
+    started = time.monotonic()
+    try:
+        image = get()
+    except Exception as e:
+        ctx.events.emit(
+            "image_end", source=str(source), ok=False, seconds=time.monotonic() - started, error=str(e)
+        )
+        raise
+    ctx.events.emit(
+        "image_end", source=str(source), ok=True, seconds=time.monotonic() - started, bytes=len(image[0])
+    )
+    return image
+
+
+def _coalesce_runs(runs: list) -> list:
+    """Drops empty runs and merges adjacent plain runs with identical formatting"""
+    coalesced = []
+    pieces = []  # texts of plain runs being merged into the last coalesced run
+    for run in runs:
+        if run._plain():
+            # Empty runs would only become empty `w:r` elements
+            if run.text == "":
+                continue
+            # Extend previous run if it looks the same
+            if pieces and coalesced[-1]._formatting() == run._formatting():
+                pieces.append(run.text)
+                continue
+        # Finish merging into previous run
+        if len(pieces) > 1:
+            coalesced[-1].text = "".join(pieces)
+        pieces = [run.text] if run._plain() else []
+        coalesced.append(run)
+    if len(pieces) > 1:
+        coalesced[-1].text = "".join(pieces)
+    return coalesced
+
+
+class _Finder:
+    """Finds the next occurrence of a substring from increasing start positions,
+    resuming where the last search stopped so a whole line is only scanned once"""
+
+    def __init__(self, line: str, sub: str) -> None:
+        self.line = line
+        self.sub = sub
+        self.start = 0
+        self.found = -2  # -2 for not searched yet, -1 for no occurrences left
+
+    def next(self, start: int) -> int:
+        """Gets index of first occurrence at or after `start`, or -1 if there isn't one"""
+        # Searching backwards would break the cache so just start again
+        if start < self.start:
+            return self.line.find(self.sub, start)
+        self.start = start
+        if self.found == -1 or self.found >= start:
+            return self.found
+        self.found = self.line.find(self.sub, start)
+        return self.found
+
+
+class _LinkScanner:
+    r"""Linear-time matcher for inline links and images, matching the same text as
+    `^(!?)\[(.+?)\]\((.+?)(\s+"(.+?)")?\)` would at each offset of a line"""
+
+    TITLE_START = re.compile(r'\s"')
+
+    def __init__(self, line: str) -> None:
+        self.line = line
+        self.brackets = _Finder(line, "](")
+        self.parens = _Finder(line, ")")
+        self.title_ends = _Finder(line, '")')
+
+    def match(self, ind: int) -> tuple | None:
+        """Matches link or image at `ind`, returning its end index, if it's an image, its text,
+        link and title; offsets must be given in increasing order"""
+        line = self.line
+        # Link or image opener
+        is_image = line.startswith("![", ind)
+        if not is_image and not line.startswith("[", ind):
+            return None
+        start = ind + 2 if is_image else ind + 1
+        # Text is everything up to the first `](`, requiring at least one character
+        bracket = self.brackets.next(start + 1)
+        if bracket == -1:
+            return None
+        # Link is at least one character up to the first `)`
+        paren = self.parens.next(bracket + 3)
+        if paren == -1:
+            return None
+        text = line[start:bracket]
+        # Optional title is whitespace then a quoted string before the link would have ended
+        title_start = self.TITLE_START.search(line, bracket + 3, paren)
+        if title_start:
+            quote = title_start.start() + 1
+            title_end = self.title_ends.next(quote + 2)
+            if title_end != -1:
+                # Link ends where its trailing whitespace starts
+                link_end = title_start.start()
+                while link_end > bracket + 3 and line[link_end - 1].isspace():
+                    link_end -= 1
+                link = line[bracket + 2 : link_end]
+                return (title_end + 2, is_image, text, link, line[quote + 1 : title_end])
+        return (paren + 1, is_image, text, line[bracket + 2 : paren], None)
+
+
+def _run_cheeky(ctx: Context, line: str, ind: int) -> tuple:
+    """Run parsing for cheeky links (the <> links) starting at `ind`"""
 
     # Metadata
-    link = ""
+    link = []
     flipflop = False
+    end = ind + 1
 
     # Go through each character
-    for c in line[1:]:
+    while end < len(line):
+        c = line[end]
+        end += 1
         # Flipflop
         if flipflop:
             flipflop = False
-            link += c
+            link.append(c)
         # Backslash for flipflop
         elif c == "\\":
             flipflop = True
@@ -480,19 +664,22 @@ def _run_cheeky(ctx: Context, line: str) -> tuple:
             break
         # Character in link
         else:
-            link += c
+            link.append(c)
 
     # Construct new run
+    link = "".join(link)
     run = Run(ctx, link, link=(link, True))
 
-    # Return ind and link
-    return len(link) + 2, run
+    # Return characters consumed and link
+    return end - ind, run
 
-def _run_ib(ctx: Context, line: str) -> int:
-    """Run parsing for italics and bold"""
+def _run_ib(ctx: Context, line: str, ind: int) -> int:
+    """Run parsing for italics and bold starting at `ind`"""
 
     # Get star count
-    stars = len(line) - len(line.lstrip("*"))
+    stars = 0
+    while ind + stars < len(line) and line[ind + stars] == "*":
+        stars += 1
 
     # Italics for non-even
     if stars % 2 == 1:
@@ -503,4 +690,4 @@ def _run_ib(ctx: Context, line: str) -> int:
         ctx.flip_bold()
 
     # Add star count to index
-    return stars
\ No newline at end of file
+    return stars
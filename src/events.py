@@ -0,0 +1,86 @@
+import json
+import time
+from typing import Callable
+
+
+class Event:
+    """Something which happened during conversion, given to listeners"""
+
+    def __init__(self, kind: str, elapsed: float, data: dict) -> None:
+        self.kind = kind  # e.g. `phase_start`, `element`, `image_end`, `write`
+        self.elapsed = elapsed  # seconds since conversion started
+        self.data = data
+
+    def _json(self) -> str:
+        """Gets event as a single json line"""
+        return json.dumps(
+            {"event": self.kind, "elapsed": round(self.elapsed, 6), **self.data},
+            ensure_ascii=False,
+            default=str,
+        )
+
+
+class Events:
+    """Delivers conversion events to an optional listener, doing nothing without one"""
+
+    def __init__(self, listener: Callable[[Event], None] | None = None) -> None:
+        self.listener = listener
+        self.started = time.monotonic()
+
+    def emit(self, kind: str, **data):
+        """Gives new event to listener; hot paths should check `listener` first to skip building `data`"""
+        if self.listener is not None:
+            self.listener(Event(kind, time.monotonic() - self.started, data))
+
+    def phase(self, name: str):
+        """Gets context manager which emits start and end of a conversion phase"""
+        return _Phase(self, name)
+
+
+class _Phase:
+    """Emits `phase_start` and `phase_end` events around a block"""
+
+    def __init__(self, events: Events, name: str) -> None:
+        self.events = events
+        self.name = name
+        self.started = 0
+
+    def __enter__(self):
+        if self.events.listener is not None:
+            self.started = time.monotonic()
+            self.events.emit("phase_start", phase=self.name)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.events.listener is not None:
+            self.events.emit(
+                "phase_end",
+                phase=self.name,
+                seconds=time.monotonic() - self.started,
+                ok=exc_type is None,
+            )
+        return False
+
+
+class _ProgressWriter:
+    """File wrapper which emits `write` events as docx zip data gets written"""
+
+    STEP = 256 * 1024  # bytes between events
+
+    def __init__(self, file, events: Events) -> None:
+        self.file = file
+        self.events = events
+        self.written = 0
+        self.reported = 0
+
+    def write(self, data) -> int:
+        count = self.file.write(data)
+        self.written += len(data)
+        if self.written - self.reported >= self.STEP:
+            self.reported = self.written
+            self.events.emit("write", bytes=self.written)
+        return count
+
+    def __getattr__(self, name):
+        # Zipfile also needs tell/seek/flush, which go straight through
+        return getattr(self.file, name)
@@ -0,0 +1,122 @@
+import time
+import threading
+import PIL.Image
+from io import BytesIO
+from pathlib import Path
+from collections import OrderedDict
+from .limits import LimitExceeded
+
+
+class ImageStore:
+    """Thread-safe cache of image bytes and dimensions which can be shared between documents"""
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 1024 * 1024,
+        timeout: float = 10,
+        remote_ttl: float = 300,
+    ) -> None:
+        self.max_bytes = max_bytes  # total image bytes kept before evicting least recently used
+        self.timeout = timeout  # seconds per remote fetch
+        self.remote_ttl = remote_ttl  # seconds a downloaded image is reused for, 0 to always download
+        self._lock = threading.Lock()
+        self._session = None
+        self._entries = OrderedDict()  # key -> ((data, (width, height)), `time.monotonic()` stored)
+        self._size = 0
+
+    def remote(self, url: str, max_bytes: int | None = None, deadline: float | None = None) -> tuple:
+        """Gets bytes and dimensions of an image at `url`, downloading it if not cached within
+        `remote_ttl`; downloads stop early once over `max_bytes` or past the `time.monotonic()` `deadline`"""
+        cached = self._get(url, self.remote_ttl)
+        if cached is not None:
+            return cached
+        # Fetch outside the lock, so concurrent misses for one url may both download
+        return self._put(url, self._download(url, max_bytes, deadline))
+
+    def _download(self, url: str, max_bytes: int | None, deadline: float | None) -> bytes:
+        """Downloads `url` a read at a time, each read waiting only as long as is left before
+        `deadline`, so servers dripping bytes out can't keep it going"""
+        started = time.monotonic()
+        try:
+            with self._get_session().get(url, timeout=self._time_left(deadline), stream=True) as response:
+                response.raise_for_status()
+                chunks = []
+                size = 0
+                while True:
+                    # `iter_content` waits for whole chunks, however long they take to trickle in
+                    sock = getattr(response.raw.connection, "sock", None)
+                    if sock is not None:
+                        sock.settimeout(self._time_left(deadline))
+                    chunk = response.raw.read1(1 << 16, decode_content=True)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise LimitExceeded("max_image_bytes", size, max_bytes)
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise TimeoutError(f"{url} 下载超时")
+        except LimitExceeded:
+            raise
+        except Exception as e:
+            # Timeouts are set to end on the deadline, so running out of time aborts like other limits
+            # rather than looking like a broken server
+            if deadline is not None and time.monotonic() >= deadline:
+                elapsed = round(time.monotonic() - started, 3)
+                raise LimitExceeded("deadline", elapsed, round(deadline - started, 3)) from e
+            raise
+        return b"".join(chunks)
+
+    def _time_left(self, deadline: float | None) -> float:
+        """Gets seconds the next wait on the server may take, never past `deadline`"""
+        if deadline is None:
+            return self.timeout
+        return max(min(self.timeout, deadline - time.monotonic()), 0.001)
+
+    def local(self, path: Path) -> tuple:
+        """Gets bytes and dimensions of a local image, reading it if not cached or changed"""
+        stat = path.stat()
+        key = (str(path.absolute()), stat.st_mtime_ns, stat.st_size)
+        cached = self._get(key)
+        if cached is not None:
+            return cached
+        return self._put(key, path.read_bytes())
+
+    def _get_session(self) -> "requests.Session":
+        """Gets shared http session, creating it on first use; its connection pool is thread-safe"""
+        # Requests takes longer to import than everything else put together, so only documents
+        # with remote images pay for it
+        import requests
+
+        with self._lock:
+            if self._session is None:
+                self._session = requests.Session()
+            return self._session
+
+    def _get(self, key, ttl: float | None = None) -> tuple | None:
+        with self._lock:
+            cached = self._entries.get(key)
+            # Expired entries are left for `_put` to replace
+            if cached is None or (ttl is not None and time.monotonic() - cached[1] >= ttl):
+                return None
+            self._entries.move_to_end(key)
+            return cached[0]
+
+    def _put(self, key, data: bytes) -> tuple:
+        # Only the header is read here, so this is cheap compared to decoding
+        with PIL.Image.open(BytesIO(data)) as img:
+            entry = (data, img.size)
+        # Too big to ever be cached
+        if len(data) > self.max_bytes:
+            return entry
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[0][0])
+            self._entries[key] = (entry, time.monotonic())
+            self._size += len(data)
+            # Evict least recently used until we fit again
+            while self._size > self.max_bytes:
+                _, ((old, _), _) = self._entries.popitem(last=False)
+                self._size -= len(old)
+        return entry
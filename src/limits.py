@@ -0,0 +1,153 @@
+import time
+from pathlib import Path
+
+
+# Limits which only affect a single image, so can be degraded to a placeholder
+IMAGE_LIMITS = ["max_fetches", "max_image_bytes", "max_total_image_bytes"]
+
+
+class LimitExceeded(Exception):
+    """Conversion went over one of its `Limits`"""
+
+    def __init__(self, limit: str, value, maximum) -> None:
+        super().__init__(f"{limit} 超出限制 ({value} > {maximum})")
+        self.limit = limit  # name of the `Limits` field which was exceeded
+        self.value = value
+        self.maximum = maximum
+
+
+class Limits:
+    """Resource limits for a single conversion, where `None` means unlimited"""
+
+    def __init__(
+        self,
+        deadline: float | None = None,
+        max_fetches: int | None = None,
+        max_image_bytes: int | None = None,
+        max_total_image_bytes: int | None = None,
+        max_output_bytes: int | None = None,
+        max_elements: int | None = None,
+        degrade: bool = False,
+    ) -> None:
+        self.deadline = deadline  # seconds for parsing and saving together
+        self.max_fetches = max_fetches  # remote images fetched
+        self.max_image_bytes = max_image_bytes  # bytes of any one image
+        self.max_total_image_bytes = max_total_image_bytes  # bytes of every image together
+        self.max_output_bytes = max_output_bytes  # bytes of the saved docx
+        self.max_elements = max_elements  # elements, counting code lines and table cells
+        self.degrade = degrade  # replace images going over limits with placeholders instead of aborting
+
+    @staticmethod
+    def service():
+        """Reasonable limits for converting untrusted markdown in a service"""
+        return Limits(
+            deadline=60,
+            max_fetches=50,
+            max_image_bytes=10 * 1024 * 1024,
+            max_total_image_bytes=100 * 1024 * 1024,
+            max_output_bytes=200 * 1024 * 1024,
+            max_elements=200_000,
+            degrade=True,
+        )
+
+
+class Budget:
+    """Tracks what a single conversion has used against its limits"""
+
+    def __init__(self, limits: Limits | None = None) -> None:
+        self.limits = limits if limits is not None else Limits()
+        self.started = time.monotonic()
+        self.fetches = 0
+        self.image_bytes = 0
+        self.elements = 0
+
+    def check_deadline(self):
+        """Aborts if conversion has gone past its deadline"""
+        if self.limits.deadline is None:
+            return
+        elapsed = time.monotonic() - self.started
+        if elapsed > self.limits.deadline:
+            raise LimitExceeded("deadline", round(elapsed, 3), self.limits.deadline)
+
+    def add_elements(self, count: int = 1):
+        """Counts newly parsed elements, aborting if there's too many"""
+        self.elements += count
+        if self.limits.max_elements is not None and self.elements > self.limits.max_elements:
+            raise LimitExceeded("max_elements", self.elements, self.limits.max_elements)
+
+    def remote(self, images, url: str) -> tuple:
+        """Gets a remote image from `images` if it fits within limits"""
+        self.check_deadline()
+        self.fetches += 1
+        if self.limits.max_fetches is not None and self.fetches > self.limits.max_fetches:
+            raise LimitExceeded("max_fetches", self.fetches, self.limits.max_fetches)
+        deadline = None
+        if self.limits.deadline is not None:
+            deadline = self.started + self.limits.deadline
+        return self._add_image(images.remote(url, self.limits.max_image_bytes, deadline))
+
+    def local(self, images, path: Path) -> tuple:
+        """Gets a local image from `images` if it fits within limits"""
+        self.check_deadline()
+        if self.limits.max_image_bytes is not None:
+            size = path.stat().st_size
+            if size > self.limits.max_image_bytes:
+                raise LimitExceeded("max_image_bytes", size, self.limits.max_image_bytes)
+        return self._add_image(images.local(path))
+
+    def degrades(self, e: LimitExceeded) -> bool:
+        """Checks if going over a limit should become a placeholder rather than aborting conversion"""
+        return self.limits.degrade and e.limit in IMAGE_LIMITS
+
+    def check_output(self, size: int):
+        """Aborts if saved docx is too big"""
+        if self.limits.max_output_bytes is not None and size > self.limits.max_output_bytes:
+            raise LimitExceeded("max_output_bytes", size, self.limits.max_output_bytes)
+
+    def _add_image(self, image: tuple) -> tuple:
+        data = image[0]
+        if self.limits.max_image_bytes is not None and len(data) > self.limits.max_image_bytes:
+            raise LimitExceeded("max_image_bytes", len(data), self.limits.max_image_bytes)
+        # Images which get degraded aren't counted against the total
+        total = self.image_bytes + len(data)
+        maximum = self.limits.max_total_image_bytes
+        if maximum is not None and total > maximum:
+            raise LimitExceeded("max_total_image_bytes", total, maximum)
+        self.image_bytes = total
+        return image
+
+
+class _LimitedWriter:
+    """File wrapper which aborts as soon as a docx being saved goes over `max_output_bytes`,
+    so output never has to be held anywhere to find out how big it is"""
+
+    def __init__(self, file, budget: Budget) -> None:
+        self.file = file
+        self.budget = budget
+        self.exceeded = False
+
+    def write(self, data) -> int:
+        # Zipfile carries on writing while the error unwinds and once it's collected, which goes nowhere
+        if self.exceeded:
+            return len(data)
+        # Zipfile seeks back to fill in headers, so the file is as big as the furthest write
+        try:
+            self.budget.check_output(self.file.tell() + len(data))
+        except LimitExceeded:
+            self.exceeded = True
+            raise
+        return self.file.write(data)
+
+    def tell(self) -> int:
+        return 0 if self.exceeded else self.file.tell()
+
+    def seek(self, *args) -> int:
+        return 0 if self.exceeded else self.file.seek(*args)
+
+    def flush(self):
+        if not self.exceeded:
+            self.file.flush()
+
+    def __getattr__(self, name):
+        # Anything else zipfile needs goes straight through
+        return getattr(self.file, name)
@@ -0,0 +1,112 @@
+import json
+import hashlib
+from pathlib import Path
+from .styles import Style
+
+# Version of how markdown is rendered, separate from the package version so releases which don't
+# change output don't rebuild everything. Bump it whenever the same markdown, images, style and
+# options would give a different docx: 2 added heading bookmarks, 3 restarted numbered lists
+RENDER_VERSION = 3
+MISSING = "missing"  # hash recorded for images which didn't exist at build time
+
+
+class Manifest:
+    """Record of everything an output docx was built from, used for up-to-date checks"""
+
+    def __init__(self, md: str, images: dict, style: dict, options: dict, version: int = RENDER_VERSION):
+        self.md = md  # markdown source hash
+        self.images = images  # resolved local image path -> hash, or `MISSING`
+        self.style = style  # style fields
+        self.options = options  # output options from `_output_options()`
+        self.version = version  # `RENDER_VERSION` which built the output
+
+    @staticmethod
+    def _build(md: str, document, style: Style, options: dict):
+        """Creates manifest for a freshly converted document, saved with `options` from `_output_options()`"""
+        images = {}
+        for path in document.local_images():
+            images[str(path.absolute())] = _hash_file(path) if path.exists() else MISSING
+        return Manifest(_hash_text(md), images, _style_fields(style), options)
+
+    @staticmethod
+    def load(docx_path: Path):
+        """Loads manifest stored alongside `docx_path`, returning `None` if there isn't a valid one"""
+        try:
+            with open(_manifest_path(docx_path), "r", encoding="utf-8") as file:
+                data = json.load(file)
+            return Manifest(data["md"], data["images"], data["style"], data["options"], data["version"])
+        except Exception:
+            return None
+
+    def save(self, docx_path: Path):
+        """Saves manifest alongside `docx_path`"""
+        data = {
+            "version": self.version,
+            "md": self.md,
+            "style": self.style,
+            "options": self.options,
+            "images": self.images,
+        }
+        with open(_manifest_path(docx_path), "w", encoding="utf-8") as file:
+            json.dump(data, file, indent=2, ensure_ascii=False, sort_keys=True)
+
+    def outdated(self, md: str, style: Style, options: dict) -> str | None:
+        """Gets reason why output built from this manifest is outdated, or `None` if it's up-to-date"""
+        if self.version != RENDER_VERSION:
+            return f"渲染版本变更 ({self.version} -> {RENDER_VERSION})"
+        if self.style != _style_fields(style):
+            return "样式变更"
+        if self.options != options:
+            return "输出选项变更"
+        if self.md != _hash_text(md):
+            return "Markdown 变更"
+        for path, digest in self.images.items():
+            if digest == MISSING:
+                if Path(path).exists():
+                    return f"图片新增: {path}"
+                continue
+            if not Path(path).exists():
+                return f"图片缺失: {path}"
+            if _hash_file(Path(path)) != digest:
+                return f"图片变更: {path}"
+        return None
+
+
+def check(md: str, docx_path: Path, style: Style, options: dict) -> str | None:
+    """Gets reason why `docx_path` saved with `options` from `_output_options()` needs rebuilding,
+    or `None` if it's up-to-date"""
+    if not docx_path.exists():
+        return "输出文件不存在"
+    manifest = Manifest.load(docx_path)
+    if manifest is None:
+        return "无构建清单"
+    return manifest.outdated(md, style, options)
+
+
+def _output_options(deterministic: bool = False) -> dict:
+    """Gets options which change the bytes of an output docx, compared between builds like styles"""
+    return {"deterministic": deterministic}
+
+
+def _manifest_path(docx_path: Path) -> Path:
+    """Gets path of the manifest stored alongside an output docx"""
+    return docx_path.with_name(docx_path.name + ".mdcx.json")
+
+
+def _style_fields(style: Style) -> dict:
+    """Gets comparable fields of a style"""
+    return dict(vars(style))
+
+
+def _hash_text(text: str) -> str:
+    """Hashes a string with sha256"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _hash_file(path: Path) -> str:
+    """Hashes a file's contents with sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,60 @@
+import os
+import datetime
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+from docx.opc.pkgwriter import PackageWriter
+
+EPOCH = datetime.datetime(1980, 1, 1)  # earliest time zip files can hold
+
+
+def _save_reproducible(docx_doc, file):
+    """Saves docx to a path or file so the same document always gives the same bytes, by fixing
+    zip entry times and core property dates; `SOURCE_DATE_EPOCH` overrides the fixed time"""
+    timestamp = _timestamp()
+
+    # Core properties get dates and revisions from whenever the template was made
+    core = docx_doc.core_properties
+    core.created = timestamp
+    core.modified = timestamp
+    core.last_modified_by = ""
+    core.revision = 1
+    _write_zip(docx_doc, file, timestamp)
+
+
+def _write_zip(docx_doc, file, timestamp: datetime.datetime):
+    """Same as python-docx's `OpcPackage.save()` but giving every zip entry the same `timestamp`"""
+    package = docx_doc.part.package
+    for part in package.parts:
+        part.before_marshal()
+    writer = _ZipWriter(file, timestamp)
+    PackageWriter._write_content_types_stream(writer, package.parts)
+    PackageWriter._write_pkg_rels(writer, package.rels)
+    PackageWriter._write_parts(writer, package.parts)
+    writer.close()
+
+
+def _timestamp() -> datetime.datetime:
+    """Gets fixed time for output, from `SOURCE_DATE_EPOCH` if it's set like reproducible builds do"""
+    epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    if not epoch:
+        return EPOCH
+    timestamp = datetime.datetime.fromtimestamp(int(epoch), datetime.timezone.utc).replace(tzinfo=None)
+    return max(timestamp, EPOCH)
+
+
+class _ZipWriter:
+    """Zip writer for python-docx's `PackageWriter` which gives every entry the same metadata, as
+    `writestr()` otherwise stamps entries with the current time and platform"""
+
+    def __init__(self, file, timestamp: datetime.datetime) -> None:
+        self.zip = ZipFile(file, "w", compression=ZIP_DEFLATED)
+        self.date_time = timestamp.timetuple()[:6]
+
+    def write(self, pack_uri, blob):
+        info = ZipInfo(pack_uri.membername, self.date_time)
+        info.compress_type = ZIP_DEFLATED
+        info.create_system = 3  # unix, whichever platform we're on
+        info.external_attr = 0o644 << 16
+        self.zip.writestr(info, blob)
+
+    def close(self):
+        self.zip.close()
@@ -40,5 +40,9 @@ class Style:
             False,
         )
 
+    def _key(self) -> tuple:
+        """Gets hashable key of every style field, for caching things built from a style"""
+        return tuple(sorted(vars(self).items()))
+
     def _body_alignment(self) -> int:
         return 3 if self.body_justified else 0
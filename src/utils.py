@@ -1,7 +1,13 @@
+import re
 import sys
 import docx
+import weakref
+from copy import deepcopy
 from pathlib import Path
 
+_BREAKS = re.compile(r"[\t\r\n]")  # characters python-docx turns into tabs and breaks within runs
+_PARTS = weakref.WeakKeyDictionary()  # docx part -> {state class: state}, dropped along with the part
+
 
 def _style_title_border(style_title):
     """Removes border style on title which is set by python-docx by default.
@@ -47,6 +53,44 @@ def _is_bib(text: str) -> bool:
     return text.lower() in ["bibliography", "references"]
 
 
+def _front_matter(lines: list[str]) -> tuple[dict, list[str]]:
+    """Splits metadata like `title: Something` between `---` lines off the start of lines,
+    returning metadata with lowercase keys and the remaining lines"""
+    metadata = {}
+    if len(lines) > 1 and lines[0] == "---":
+        # Go over lines in metadata
+        skip = 0
+        for ind, line in enumerate(lines[1:]):
+            # Stop metadata if it's ended
+            if line == "---":
+                skip = ind + 1
+                break
+            # Split at `:` token
+            splitted = line.split(":", 1)
+            # Go to next line if its invalid
+            if len(splitted) != 2:
+                continue
+            # Clean left and right sections
+            metadata[splitted[0].lstrip().lower()] = splitted[1].lstrip()
+        # Skip to end of metadata if there was an open and close tag
+        if skip != 0:
+            lines = lines[1 + skip :]
+    return metadata, lines
+
+
+def _match_image(line: str) -> str | None:
+    """Matches a line-level image the same as `^!\\[.*\\]\\(.+\\)` would, without the
+    quadratic backtracking that regex has on lines with many `](` but no `)`"""
+    if not line.startswith("!["):
+        return None
+    # Needs a `](` then at least one character then a `)`, greedily taking the last one
+    bracket = line.find("](", 2)
+    paren = line.rfind(")")
+    if bracket == -1 or paren < bracket + 3:
+        return None
+    return line[: paren + 1]
+
+
 def _level_info(line: str) -> tuple:
     """Figures out level information and returns it and the line without spacing"""
     stripped = line.lstrip()
@@ -71,10 +115,7 @@ def _add_link(
     # Set where it links to
     if external:
         # This gets access to the document.xml.rels file and gets a new relation id value
-        part = paragraph.part
-        r_id = part.relate_to(
-            link, docx.opc.constants.RELATIONSHIP_TYPE.HYPERLINK, is_external=True
-        )
+        r_id = _per_part(paragraph.part, _LinkIndex).relate(link)
         # External relationship value
         hyperlink.set(docx.oxml.shared.qn("r:id"), r_id)
     else:
@@ -90,16 +131,216 @@ def _add_link(
     run_prop.append(run_style)
     # Join all the xml elements together add add the required text to the w:r element
     new_run.append(run_prop)
-    new_run.text = text
+    if _BREAKS.search(text) is None:
+        new_run.add_t(text)
+    else:
+        new_run.text = text
     hyperlink.append(new_run)
     # Add to paragraph
     paragraph._p.append(hyperlink)
     return hyperlink
 
 
-def _is_bib(text: str) -> bool:
-    """Checks if provided heading text is referencing a bibliography"""
-    return text.lower() in ["bibliography", "references"]
+def _per_part(part, cls):
+    """Gets `cls(part)` for a docx part, creating it on first use so it lives as long as the part.
+    State is kept here rather than on python-docx's objects, and only holds weak proxies to the
+    part so it doesn't keep it alive"""
+    states = _PARTS.setdefault(part, {})
+    state = states.get(cls)
+    if state is None:
+        state = states[cls] = cls(part)
+    return state
+
+
+class _LinkIndex:
+    """Index of external hyperlink relationships for a docx part, as python-docx's `relate_to()`
+    scans every relationship each time which makes link-heavy documents quadratic"""
+
+    def __init__(self, part) -> None:
+        self.part = weakref.proxy(part)
+        self.ids = {}  # url -> relationship id
+        self.next = 1
+        # Index relationships which were already there
+        for rel in part.rels.values():
+            if rel.is_external and rel.reltype == docx.opc.constants.RELATIONSHIP_TYPE.HYPERLINK:
+                self.ids.setdefault(rel.target_ref, rel.rId)
+
+    def relate(self, link: str) -> str:
+        """Gets relationship id for external `link`, reusing one if it's been linked to before"""
+        r_id = self.ids.get(link)
+        if r_id is not None:
+            return r_id
+        # Find next free id, which python-docx may have taken for images since
+        while f"rId{self.next}" in self.part.rels:
+            self.next += 1
+        r_id = f"rId{self.next}"
+        self.part.rels.add_relationship(
+            docx.opc.constants.RELATIONSHIP_TYPE.HYPERLINK, link, r_id, is_external=True
+        )
+        self.ids[link] = r_id
+        return r_id
+
+
+class _Prototypes:
+    """Pre-styled paragraph and run xml for a docx part, which gets cloned for each new paragraph
+    and run instead of going through python-docx looking up styles and formatting every time"""
+
+    def __init__(self, part) -> None:
+        self.body = part.element.body
+        self.sect_pr = self.body.sectPr  # new paragraphs go before this, like python-docx does
+        self.paragraphs = {}  # (style name, variant) -> w:p
+        self.runs = {}  # (bold, italic, underline, strikethrough) -> w:r
+
+    def paragraph(
+        self, docx_doc: docx.Document, style: str | None = None, setup=None, variant=None
+    ) -> docx.text.paragraph.Paragraph:
+        """Adds new empty paragraph with `style` to the end of the document, optionally with `setup`
+        applied to its prototype once for each `variant` of the style, e.g. quote indents per level"""
+        key = (style, variant)
+        prototype = self.paragraphs.get(key)
+        if prototype is None:
+            # Build prototype through python-docx once so it's identical to what it would make
+            prototype = docx.oxml.shared.OxmlElement("w:p")
+            docx_prototype = docx.text.paragraph.Paragraph(prototype, docx_doc._body)
+            if style is not None:
+                docx_prototype.style = style
+            if setup is not None:
+                setup(docx_prototype)
+            self.paragraphs[key] = prototype
+        p = deepcopy(prototype)
+        if self.sect_pr is not None:
+            self.sect_pr.addprevious(p)
+        else:
+            self.body.append(p)
+        return docx.text.paragraph.Paragraph(p, docx_doc._body)
+
+    def run(self, docx_para: docx.text.paragraph.Paragraph, text: str, formatting: tuple) -> docx.text.run.Run:
+        """Adds new run with `text` and `formatting` of `(bold, italic, underline, strikethrough)`"""
+        prototype = self.runs.get(formatting)
+        if prototype is None:
+            # Build prototype through python-docx once so it's identical to what it would make
+            prototype = docx.oxml.shared.OxmlElement("w:r")
+            docx_run = docx.text.run.Run(prototype, docx_para)
+            bold, italic, underline, strikethrough = formatting
+            if bold:
+                docx_run.bold = True
+            if italic:
+                docx_run.italic = True
+            if underline:
+                docx_run.underline = True
+            if strikethrough:
+                docx_run.font.strike = True
+            self.runs[formatting] = prototype
+        r = deepcopy(prototype)
+        # Plain text goes straight in one `w:t`, as python-docx's `text` handles one character at a time
+        if text and _BREAKS.search(text) is None:
+            r.add_t(text)
+        elif text:
+            r.text = text
+        docx_para._p.append(r)
+        return docx.text.run.Run(r, docx_para)
+
+
+class _Numbering:
+    """Numbering instances for a docx part, so each numbered list restarts from the number it
+    starts at in markdown.
+
+    Lists keep using the abstract numbering their `List Number` style has in the template, and
+    each list just gets a small `w:num` restarting it. Ids are counted here instead of going
+    through python-docx, which scans every `w:num` to find the next free id, and list items are
+    cloned from prototypes set up by `_numbered()` so only their id needs filling in."""
+
+    def __init__(self, part) -> None:
+        self.part = weakref.proxy(part)
+        self.numbering = part.numbering_part.element
+        self.cleanup = self.numbering.find(docx.oxml.ns.qn("w:numIdMacAtCleanup"))  # nums go before this
+        self.next = max([num.numId for num in self.numbering.num_lst], default=0) + 1
+        self.abstracts = {}  # style name -> abstract numbering id, or None if it isn't numbered
+        self.lists = {}  # level -> num id of list being continued
+        self.last = None  # w:p of last list item
+        self.prototype = docx.oxml.numbering.CT_Num.new(0, 0)  # w:num which gets cloned for each list
+        self.prototype.add_lvlOverride(0).add_startOverride(1)
+
+    @staticmethod
+    def _numbered(docx_para: docx.text.paragraph.Paragraph):
+        """Sets up prototype paragraph for numbered list items, which get their id from `item()`"""
+        num_pr = docx_para._p.get_or_add_pPr().get_or_add_numPr()
+        num_pr.get_or_add_ilvl().val = 0
+        num_pr.get_or_add_numId().val = 0
+
+    def item(self, docx_para: docx.text.paragraph.Paragraph, style: str, level: int, start: int | None = None):
+        """Numbers a list item paragraph at `level`, continuing the list it's in or restarting at
+        `start`; bullet points have no `start` and only end numbered lists at their level"""
+        p = docx_para._p
+        # Anything else between list items ends every list
+        if p.getprevious() is not self.last:
+            self.lists.clear()
+        self.last = p
+        # Lists nested under an earlier item start again under this one
+        for deeper in [other for other in self.lists if other > level]:
+            del self.lists[deeper]
+        if start is None:
+            self.lists.pop(level, None)
+            return
+
+        # Restart list if this is its first item
+        num_id = self.lists.get(level)
+        if num_id is None:
+            num_id = self._restart(style, start)
+            if num_id is None:
+                return
+            self.lists[level] = num_id
+        p.pPr.numPr.numId.set(docx.oxml.ns.qn("w:val"), str(num_id))
+
+    def _restart(self, style: str, start: int) -> int | None:
+        """Adds new numbering instance of a style's abstract numbering starting at `start`"""
+        if style not in self.abstracts:
+            self.abstracts[style] = self._abstract(style)
+        abstract = self.abstracts[style]
+        if abstract is None:
+            return None
+        num_id = self.next
+        self.next += 1
+        num = deepcopy(self.prototype)
+        num.set(docx.oxml.ns.qn("w:numId"), str(num_id))
+        num.abstractNumId.set(docx.oxml.ns.qn("w:val"), str(abstract))
+        num.lvlOverride_lst[0].startOverride.set(docx.oxml.ns.qn("w:val"), str(start))
+        if self.cleanup is not None:
+            self.cleanup.addprevious(num)
+        else:
+            self.numbering.append(num)
+        return num_id
+
+    def _abstract(self, style: str) -> int | None:
+        """Gets abstract numbering id a style is numbered with in the template, if it is"""
+        p_pr = self.part.styles[style].element.pPr
+        if p_pr is None or p_pr.numPr is None or p_pr.numPr.numId is None:
+            return None
+        try:
+            return self.numbering.num_having_numId(p_pr.numPr.numId.val).abstractNumId.val
+        except KeyError:
+            return None
+
+
+def _slug(text: str) -> str:
+    """Gets the anchor markdown renderers give a heading, e.g. `Hello, World` to `hello-world`"""
+    return re.sub(r"[^\w\- ]", "", text.strip().lower()).replace(" ", "-")
+
+
+def _bookmark(docx_para: docx.text.paragraph.Paragraph, bookmark_id: int, name: str):
+    """Wraps a paragraph's contents in a bookmark so internal links can go to it"""
+    start = docx.oxml.shared.OxmlElement("w:bookmarkStart")
+    start.set(docx.oxml.shared.qn("w:id"), str(bookmark_id))
+    start.set(docx.oxml.shared.qn("w:name"), name)
+    end = docx.oxml.shared.OxmlElement("w:bookmarkEnd")
+    end.set(docx.oxml.shared.qn("w:id"), str(bookmark_id))
+    # Bookmark has to come after paragraph properties
+    p = docx_para._p
+    if p.pPr is not None:
+        p.pPr.addnext(start)
+    else:
+        p.insert(0, start)
+    p.append(end)
 
 
 def get_docx_path(args: list[str], md_path: Path) -> Path:
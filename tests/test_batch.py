@@ -0,0 +1,114 @@
+import os
+import json
+import time
+from pathlib import Path
+from src.batch import WorkQueue, work, _build_key
+from src.converter import Converter
+from src.manifest import _output_options
+from src.styles import Style
+
+
+def _corpus(tmp_path: Path) -> Path:
+    in_dir = tmp_path / "in"
+    (in_dir / "sub").mkdir(parents=True)
+    (in_dir / "good.md").write_text("# Good\n\nText", encoding="utf-8")
+    (in_dir / "sub" / "bad.md").write_text("# Bad\n\n![Missing](missing.png)", encoding="utf-8")
+    return in_dir
+
+
+def _run(tmp_path: Path, in_dir: Path, style: Style = Style.andy(), incremental: bool = False) -> dict:
+    """Runs a single worker over the queue like a batch run does, returning the report"""
+    options = _output_options()
+    args = {"in_dir": in_dir, "out_dir": tmp_path / "out", "build": _build_key(style, options), "incremental": incremental}
+    work(WorkQueue(**args), Converter(style))
+    return WorkQueue(**args).report()
+
+
+def test_rerun_converts_nothing(tmp_path):
+    in_dir = _corpus(tmp_path)
+    first = _run(tmp_path, in_dir)
+    assert (first["rebuilt"], len(first["failed"])) == (1, 1)
+    mtime = (tmp_path / "out" / "good.docx").stat().st_mtime_ns
+    _run(tmp_path, in_dir)
+    assert (tmp_path / "out" / "good.docx").stat().st_mtime_ns == mtime
+
+
+def test_style_change_converts_again(tmp_path):
+    in_dir = _corpus(tmp_path)
+    _run(tmp_path, in_dir)
+    andy = (tmp_path / "out" / "good.docx").read_bytes()
+    report = _run(tmp_path, in_dir, Style.foxtrot())
+    assert report["rebuilt"] == 1
+    assert (tmp_path / "out" / "good.docx").read_bytes() != andy
+
+
+def test_failures_retried_next_run(tmp_path):
+    in_dir = _corpus(tmp_path)
+    assert _run(tmp_path, in_dir)["failed"][0][0] == "sub/bad.md"
+    image = Path(__file__).parent.parent / "examples" / "images" / "airbnb.png"
+    (in_dir / "sub" / "missing.png").write_bytes(image.read_bytes())
+    report = _run(tmp_path, in_dir)
+    assert report["failed"] == []
+    assert report["done"] == 2
+    assert (tmp_path / "out" / "sub" / "bad.docx").exists()
+
+
+def test_incremental_uses_manifests(tmp_path):
+    in_dir = _corpus(tmp_path)
+    (in_dir / "sub" / "bad.md").unlink()
+    assert _run(tmp_path, in_dir, incremental=True)["rebuilt"] == 1
+    assert _run(tmp_path, in_dir, incremental=True)["skipped"] == 1
+    # Markers from earlier runs don't hide changes only manifests know about
+    (in_dir / "picture.png").write_bytes(b"")
+    (in_dir / "good.md").write_text("# Good\n\nSee ![picture](picture.png)", encoding="utf-8")
+    assert _run(tmp_path, in_dir, incremental=True)["rebuilt"] == 1
+    (in_dir / "picture.png").write_bytes(b"changed")
+    assert _run(tmp_path, in_dir, incremental=True)["rebuilt"] == 1
+
+
+def test_expired_claim_taken_over(tmp_path):
+    in_dir = _corpus(tmp_path)
+    queue = WorkQueue(in_dir, tmp_path / "out", lease=10)
+    item = Path("good.md")
+    assert queue.claim(item)
+    old = time.time() - 60
+    os.utime(queue._claim_path(item), (old, old))
+    other = WorkQueue(in_dir, tmp_path / "out", lease=10)
+    other.worker = "other"
+    assert other.claim(item)
+    with open(queue._claim_path(item), "r", encoding="utf-8") as file:
+        assert json.load(file)["worker"] == "other"
+
+
+def test_fresh_claim_not_taken_over(tmp_path, monkeypatch):
+    in_dir = _corpus(tmp_path)
+    item = Path("good.md")
+    first = WorkQueue(in_dir, tmp_path / "out", lease=10)
+    assert first.claim(item)
+    # Second worker saw an expired claim just before the first replaced it with this fresh one
+    second = WorkQueue(in_dir, tmp_path / "out", lease=10)
+    second.worker = "second"
+    expired = second._expired
+    checks = []
+
+    def stale_once(path):
+        checks.append(path)
+        return True if len(checks) == 1 else expired(path)
+
+    monkeypatch.setattr(second, "_expired", stale_once)
+    assert not second.claim(item)
+    with open(first._claim_path(item), "r", encoding="utf-8") as file:
+        assert json.load(file)["worker"] == first.worker
+    assert sorted(path.name for path in first.claims.iterdir()) == [first._claim_path(item).name]
+
+
+def test_removed_items_left_out(tmp_path, monkeypatch):
+    in_dir = _corpus(tmp_path)
+    queue = WorkQueue(in_dir, tmp_path / "out")
+    listed = queue.items()
+    # Removed by someone else after being listed
+    (in_dir / "sub" / "bad.md").unlink()
+    monkeypatch.setattr(queue, "items", lambda: listed)
+    assert work(queue, Converter(Style.andy())) == 1
+    report = queue.report()
+    assert (report["total"], report["done"], report["failed"]) == (1, 1, [])
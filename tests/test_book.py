@@ -0,0 +1,15 @@
+import docx
+from src.book import Book
+
+
+def test_chapter_titles_left_out(tmp_path):
+    (tmp_path / "one.md").write_text("---\ntitle: Chapter One\n---\n# One\n\nText one.", encoding="utf-8")
+    (tmp_path / "two.md").write_text("---\ntitle: Chapter Two\nsubtitle: Sub\n---\n# Two\n\nText two.", encoding="utf-8")
+    (tmp_path / "book.txt").write_text("---\ntitle: Book\n---\none.md\ntwo.md", encoding="utf-8")
+    Book.load(tmp_path / "book.txt").save(tmp_path / "book.docx")
+
+    paragraphs = docx.Document(tmp_path / "book.docx").paragraphs
+    # Only the book gets a title page, and chapters start straight away with their headings
+    assert [p.text for p in paragraphs if p.style.name in ("Title", "Subtitle")] == ["Book"]
+    texts = [p.text for p in paragraphs if p.text.strip()]
+    assert texts == ["Book", "One", "Text one.", "Two", "Text two."]
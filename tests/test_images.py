@@ -0,0 +1,52 @@
+import time
+from pathlib import Path
+from src.images import ImageStore
+
+ICON = Path(__file__).parent.parent / "examples" / "images" / "airbnb_icon.png"
+
+
+def _store(monkeypatch, remote_ttl: float) -> tuple[ImageStore, list]:
+    """Creates a store whose downloads are counted rather than made"""
+    store = ImageStore(remote_ttl=remote_ttl)
+    downloads = []
+
+    def download(url, max_bytes, deadline):
+        downloads.append(url)
+        return ICON.read_bytes()
+
+    monkeypatch.setattr(store, "_download", download)
+    return store, downloads
+
+
+def test_remote_reused_within_ttl(monkeypatch):
+    store, downloads = _store(monkeypatch, 60)
+    first = store.remote("https://example.com/icon.png")
+    assert store.remote("https://example.com/icon.png") == first
+    assert len(downloads) == 1
+
+
+def test_remote_downloaded_again_after_ttl(monkeypatch):
+    store, downloads = _store(monkeypatch, 0.05)
+    store.remote("https://example.com/icon.png")
+    time.sleep(0.1)
+    store.remote("https://example.com/icon.png")
+    assert len(downloads) == 2
+    # Replaced rather than stored twice
+    assert store._size == ICON.stat().st_size
+
+
+def test_remote_never_reused_without_ttl(monkeypatch):
+    store, downloads = _store(monkeypatch, 0)
+    store.remote("https://example.com/icon.png")
+    store.remote("https://example.com/icon.png")
+    assert len(downloads) == 2
+
+
+def test_local_read_again_once_changed(tmp_path):
+    store = ImageStore()
+    path = tmp_path / "icon.png"
+    path.write_bytes(ICON.read_bytes())
+    assert store.local(path)[0] == ICON.read_bytes()
+    other = ICON.parent / "airbnb_db.png"
+    path.write_bytes(other.read_bytes())
+    assert store.local(path)[0] == other.read_bytes()
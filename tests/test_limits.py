@@ -0,0 +1,122 @@
+import time
+import docx
+import pytest
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.document import Document
+from src.limits import Limits, LimitExceeded
+
+EXAMPLE = Path(__file__).parent.parent / "examples" / "airbnb.md"
+ICON = Path(__file__).parent.parent / "examples" / "images" / "airbnb_icon.png"
+
+
+def _table(rows: int, cols: int) -> str:
+    md = "| " + " | ".join(f"h{j}" for j in range(cols)) + " |\n|" + "---|" * cols + "\n"
+    return md + "".join("| " + " | ".join(f"r{i}c{j}" for j in range(cols)) + " |\n" for i in range(rows))
+
+
+def _expire(document: Document):
+    """Puts a parsed document's deadline in the past, so only checks while rendering can catch it"""
+    document.ctx.budget.started = time.monotonic() - document.ctx.budget.limits.deadline - 1
+
+
+def test_big_table_renders_quickly(tmp_path):
+    started = time.perf_counter()
+    Document(_table(60, 30), Path("table.md")).save(tmp_path / "table.docx")
+    assert time.perf_counter() - started < 5.0
+    table = docx.Document(tmp_path / "table.docx").tables[0]
+    assert len(table.rows) == 61
+    assert table.cell(60, 29).text == "r59c29"
+
+
+@pytest.mark.parametrize("md", [_table(10, 3), "```\n" + "code\n" * 10 + "```\n"])
+def test_deadline_checked_within_block(tmp_path, md):
+    document = Document(md, Path("block.md"), limits=Limits(deadline=60))
+    _expire(document)
+    # The only element is the block itself, so the deadline has to be checked inside it
+    element = document.elements[0]
+    with pytest.raises(LimitExceeded) as e:
+        element._docx(docx.Document())
+    assert e.value.limit == "deadline"
+
+
+@pytest.mark.parametrize("listener", [None, lambda event: None])
+def test_output_limit_stops_writing(tmp_path, listener):
+    md = EXAMPLE.read_text(encoding="utf-8")
+    out = tmp_path / "out.docx"
+    Document(md, EXAMPLE).save(out)
+    size = out.stat().st_size
+
+    document = Document(md, EXAMPLE, limits=Limits(max_output_bytes=size // 2), listener=listener)
+    with pytest.raises(LimitExceeded) as e:
+        document.save(out)
+    assert e.value.limit == "max_output_bytes"
+    # Stops part way through rather than finding out once it's all written, leaving previous output alone
+    assert e.value.value < size
+    assert out.stat().st_size == size
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["out.docx"]
+
+
+def test_output_within_limit(tmp_path):
+    out = tmp_path / "out.docx"
+    Document("# Title\n\nText", Path("small.md"), limits=Limits(max_output_bytes=1024 * 1024)).save(out)
+    assert docx.Document(out).paragraphs[-1].text == "Text"
+
+
+class _Server:
+    """Local http server sending `ICON` in pieces `delay` seconds apart"""
+
+    def __init__(self, delay: float, piece: int = 64) -> None:
+        data = ICON.read_bytes()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    for i in range(0, len(data), piece):
+                        self.wfile.write(data[i : i + piece])
+                        self.wfile.flush()
+                        time.sleep(delay)
+                except OSError:
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/icon.png"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.mark.parametrize("degrade", [False, True])
+def test_dripping_server_stopped_at_deadline(tmp_path, degrade):
+    # Every piece arrives well within any per read timeout, but all of them take over 7 seconds
+    with _Server(delay=0.1) as server:
+        limits = Limits(deadline=1.0, degrade=degrade)
+        document = Document(f"See ![icon]({server.url}) here", Path("drip.md"), limits=limits)
+        started = time.monotonic()
+        with pytest.raises(LimitExceeded) as e:
+            document.save(tmp_path / "drip.docx")
+    assert time.monotonic() - started < 2.0
+    # Aborts like other limits rather than leaving a download failed placeholder
+    assert e.value.limit == "deadline"
+    assert not (tmp_path / "drip.docx").exists()
+
+
+def test_remote_image_within_deadline(tmp_path):
+    with _Server(delay=0, piece=1024) as server:
+        document = Document(f"See ![icon]({server.url}) here", Path("fast.md"), limits=Limits(deadline=10))
+        document.save(tmp_path / "fast.docx")
+    assert len(docx.Document(tmp_path / "fast.docx").inline_shapes) == 1
@@ -0,0 +1,42 @@
+from pathlib import Path
+from src.document import Document
+from src import manifest
+from src.manifest import Manifest, check, _output_options
+from src.styles import Style
+
+
+def _build(tmp_path: Path, md: str, options: dict) -> Path:
+    """Converts `md` like an incremental build, saving its manifest alongside"""
+    md_path = tmp_path / "doc.md"
+    md_path.write_text(md, encoding="utf-8")
+    docx_path = tmp_path / "doc.docx"
+    document = Document(md, md_path)
+    document.save(docx_path, deterministic=options["deterministic"])
+    Manifest._build(md, document, Style.andy(), options).save(docx_path)
+    return docx_path
+
+
+def test_up_to_date(tmp_path):
+    docx_path = _build(tmp_path, "# Title\n\nText", _output_options())
+    assert check("# Title\n\nText", docx_path, Style.andy(), _output_options()) is None
+
+
+def test_output_options_change(tmp_path):
+    docx_path = _build(tmp_path, "# Title\n\nText", _output_options())
+    assert check("# Title\n\nText", docx_path, Style.andy(), _output_options(deterministic=True)) == "输出选项变更"
+
+
+def test_missing_image_appearing(tmp_path):
+    md = "# Title\n\nSee ![later](later.png) here"
+    docx_path = _build(tmp_path, md, _output_options())
+    assert check(md, docx_path, Style.andy(), _output_options()) is None
+    # Images which didn't exist at build time count as a change once they do
+    image = Path(__file__).parent.parent / "examples" / "images" / "airbnb.png"
+    (tmp_path / "later.png").write_bytes(image.read_bytes())
+    assert check(md, docx_path, Style.andy(), _output_options()).startswith("图片新增")
+
+
+def test_render_version_change(tmp_path, monkeypatch):
+    docx_path = _build(tmp_path, "# Title\n\nText", _output_options())
+    monkeypatch.setattr(manifest, "RENDER_VERSION", manifest.RENDER_VERSION + 1)
+    assert check("# Title\n\nText", docx_path, Style.andy(), _output_options()).startswith("渲染版本变更")
@@ -0,0 +1,52 @@
+import docx
+from pathlib import Path
+from src.document import Document
+
+
+def _items(tmp_path: Path, md: str) -> list[tuple]:
+    """Renders markdown, getting `(text, num id, start)` of every numbered paragraph in order"""
+    Document(md, Path("numbering.md")).save(tmp_path / "numbering.docx")
+    docx_doc = docx.Document(tmp_path / "numbering.docx")
+    starts = {}
+    for num in docx_doc.part.numbering_part.element.num_lst:
+        if num.lvlOverride_lst and num.lvlOverride_lst[0].startOverride is not None:
+            starts[num.numId] = num.lvlOverride_lst[0].startOverride.val
+    items = []
+    for para in docx_doc.paragraphs:
+        num_pr = para._p.pPr.numPr if para._p.pPr is not None else None
+        if num_pr is not None and num_pr.numId is not None:
+            items.append((para.text, num_pr.numId.val, starts.get(num_pr.numId.val)))
+    return items
+
+
+def test_starts_from_markdown_number(tmp_path):
+    items = _items(tmp_path, "5. five\n6. six\n7. seven")
+    assert [start for _, _, start in items] == [5, 5, 5]
+    # One list, so one numbering instance
+    assert len({num_id for _, num_id, _ in items}) == 1
+
+
+def test_list_after_paragraph_restarts(tmp_path):
+    (_, first, _), (_, second, start) = _items(tmp_path, "1. one\n\nText\n\n1. again")
+    assert first != second
+    assert start == 1
+
+
+def test_nested_list_restarts_under_each_parent(tmp_path):
+    items = _items(tmp_path, "1. a\n  1. a1\n  2. a2\n2. b\n  1. b1")
+    nums = {text: num_id for text, num_id, _ in items}
+    # Parent list carries on around nested ones
+    assert nums["a"] == nums["b"]
+    assert nums["a1"] == nums["a2"]
+    assert nums["b1"] != nums["a1"]
+    assert {text: start for text, _, start in items}["b1"] == 1
+
+
+def test_bullet_ends_numbered_list_at_its_level(tmp_path):
+    items = _items(tmp_path, "1. a\n  1. a1\n  - bullet\n  1. a2\n2. b\n- bullet\n1. c")
+    nums = {text: num_id for text, num_id, _ in items}
+    assert "bullet" not in nums
+    assert nums["a1"] != nums["a2"]
+    # A nested bullet leaves the list above it alone
+    assert nums["a"] == nums["b"]
+    assert nums["c"] != nums["a"]
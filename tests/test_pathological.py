@@ -0,0 +1,102 @@
+import re
+import time
+import random
+import pytest
+from pathlib import Path
+from src.document import Document
+from src.elements import _Finder, _LinkScanner
+
+SIZE = 50_000  # characters of each hostile input
+BUDGET = 2.0  # seconds each may take to parse; linear parsing takes well under half a second
+
+# Link/image regex `Paragraph._md` used to retry at every offset, which `_LinkScanner` replaces
+LINK = re.compile(r"(!?)\[(.+?)\]\((.+?)(\s+\"(.+?)\")?\)")
+
+CASES = {
+    "deep_brackets": "[" * SIZE,
+    "deep_images": "![" * (SIZE // 2),
+    "unclosed_links": "[a](" * (SIZE // 4),
+    "unclosed_titles": '[a](b "' * (SIZE // 7),
+    "unclosed_image_line": "![a](" * (SIZE // 5),
+    "backslashes": "\\" * SIZE,
+    "parens": "(" * SIZE,
+    "stars": "*" * SIZE,
+    "starred_words": "*a" * (SIZE // 2),
+    "unclosed_angles": "<" * SIZE,
+    "unclosed_angled_words": "<a" * (SIZE // 2),
+    "cheeky_links": "<a>" * (SIZE // 3),
+    "hashes": "#" * SIZE,
+    "long_heading": "#" * SIZE + " heading",
+    "unclosed_fence": "```\n" + "code\n" * (SIZE // 5),
+    "fences": "```\n" * (SIZE // 4),
+    "big_table": "| a | b | c |\n|---|---|---|\n" + "| 1 | 2 | 3 |\n" * (SIZE // 14),
+    "bullets": "- a\n" * (SIZE // 4),
+    "quotes": "> a\n" * (SIZE // 4),
+}
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_hostile_input_parses_in_budget(name):
+    started = time.perf_counter()
+    Document(CASES[name], Path("hostile.md"))
+    elapsed = time.perf_counter() - started
+    assert elapsed < BUDGET, f"{name} took {elapsed:.2f}s"
+
+
+def _regex_match(line: str, ind: int) -> tuple | None:
+    """Gets what the old regex matched at `ind`, in the same form as `_LinkScanner.match()`"""
+    match = LINK.match(line, ind)
+    if match is None:
+        return None
+    return (match.end(), match.group(1) == "!", match.group(2), match.group(3), match.group(5))
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "[a](b)",
+        "![a](b)",
+        "[](b)",
+        "[a]()",
+        "[a](b) [c](d)",
+        '[a](b "title")',
+        '[a](b  "title" )',
+        '[a](b "ti)tle")',
+        '[a](b "unclosed)',
+        "[[a](b)",
+        "[a]](b)",
+        "[a](b))",
+        "![[a](b)",
+        "!!![a](b)",
+        "[a\\](b)",
+    ],
+)
+def test_link_scanner_matches_regex(line):
+    scanner = _LinkScanner(line)
+    for ind in range(len(line)):
+        assert scanner.match(ind) == _regex_match(line, ind), (line, ind)
+
+
+def test_link_scanner_matches_regex_on_random_lines():
+    rng = random.Random(28)
+    for _ in range(5_000):
+        line = "".join(rng.choice('[]()!" a\t') for _ in range(rng.randint(1, 40)))
+        scanner = _LinkScanner(line)
+        # Offsets go up in irregular steps, like after skipping a matched link
+        ind = 0
+        while ind < len(line):
+            assert scanner.match(ind) == _regex_match(line, ind), (line, ind)
+            ind += rng.randint(1, 3)
+
+
+def test_finder_matches_find():
+    rng = random.Random(28)
+    for _ in range(2_000):
+        line = "".join(rng.choice("ab)") for _ in range(rng.randint(0, 30)))
+        sub = rng.choice([")", "a)", "ab"])
+        finder = _Finder(line, sub)
+        # Mostly increasing starts with the occasional step back, which searches afresh
+        start = 0
+        for _ in range(10):
+            start = max(0, start + rng.randint(-2, 5))
+            assert finder.next(start) == line.find(sub, start), (line, sub, start)
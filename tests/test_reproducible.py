@@ -0,0 +1,72 @@
+import time
+import zipfile
+import datetime
+import pytest
+from pathlib import Path
+from src.book import Book
+from src.document import Document
+
+IMAGES = Path(__file__).parent.parent / "examples" / "images"
+MD = """---
+title: Title
+---
+# Heading
+
+Text with **bold** and a [link](https://example.com).
+
+![Icon](icon.png)
+
+1. one
+2. two
+
+| a | b |
+|---|---|
+| 1 | 2 |
+"""
+
+
+def _save(tmp_path: Path, name: str, deterministic: bool = True, book: bool = False) -> bytes:
+    """Converts the same markdown afresh, as a document or a book of two chapters, returning the bytes"""
+    (tmp_path / "icon.png").write_bytes((IMAGES / "airbnb_icon.png").read_bytes())
+    (tmp_path / "doc.md").write_text(MD, encoding="utf-8")
+    out = tmp_path / name
+    if book:
+        (tmp_path / "book.txt").write_text("---\ntitle: Book\n---\ndoc.md\ndoc.md", encoding="utf-8")
+        Book.load(tmp_path / "book.txt").save(out, deterministic=deterministic)
+    else:
+        Document(MD, tmp_path / "doc.md").save(out, deterministic=deterministic)
+    return out.read_bytes()
+
+
+def _later(monkeypatch):
+    """Moves the clock a day on, which zip entry times and core properties would otherwise pick up"""
+    real = time.time
+    monkeypatch.setattr(time, "time", lambda: real() + 24 * 60 * 60)
+
+
+@pytest.mark.parametrize("book", [False, True])
+def test_byte_identical(tmp_path, monkeypatch, book):
+    first = _save(tmp_path, "first.docx", book=book)
+    _later(monkeypatch)
+    assert _save(tmp_path, "second.docx", book=book) == first
+
+
+@pytest.mark.parametrize("book", [False, True])
+def test_clock_changes_normal_output(tmp_path, monkeypatch, book):
+    # Makes sure moving the clock would be caught by the test above
+    first = _save(tmp_path, "first.docx", deterministic=False, book=book)
+    _later(monkeypatch)
+    assert _save(tmp_path, "second.docx", deterministic=False, book=book) != first
+
+
+def test_source_date_epoch(tmp_path, monkeypatch):
+    fixed = _save(tmp_path, "fixed.docx")
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1700000000")
+    first = _save(tmp_path, "first.docx")
+    _later(monkeypatch)
+    assert _save(tmp_path, "second.docx") == first
+    assert first != fixed
+    # Every zip entry is stamped with the epoch in UTC
+    expected = datetime.datetime.fromtimestamp(1700000000, datetime.timezone.utc).timetuple()[:6]
+    with zipfile.ZipFile(tmp_path / "first.docx") as docx_zip:
+        assert {info.date_time for info in docx_zip.infolist()} == {expected}
@@ -0,0 +1,123 @@
+import gc
+import docx
+import pytest
+from pathlib import Path
+from docx.oxml.ns import qn
+from src import elements, utils
+from src.context import Context
+from src.document import Document
+from src.elements import Run, _coalesce_runs
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def _render(tmp_path: Path, name: str) -> list[tuple]:
+    """Renders a fixture, getting `(text, bold, italic, link)` of every `w:r` in the body in order"""
+    md_path = FIXTURES / name
+    out = tmp_path / f"{md_path.stem}.docx"
+    Document(md_path.read_text(encoding="utf-8"), md_path).save(out)
+    runs = []
+    for r in docx.Document(out).element.body.iter(qn("w:r")):
+        run = docx.text.run.Run(r, None)
+        link = r.getparent().tag == qn("w:hyperlink")
+        runs.append((run.text, bool(run.bold), bool(run.italic), link))
+    return runs
+
+
+def _merged(runs: list[tuple]) -> list[tuple]:
+    """Drops empty runs and merges adjacent ones which look the same, for comparing what's shown"""
+    merged = []
+    for text, bold, italic, link in runs:
+        if text == "" and not link:
+            continue
+        if merged and not link and not merged[-1][3] and merged[-1][1:3] == (bold, italic):
+            merged[-1] = (merged[-1][0] + text, bold, italic, link)
+            continue
+        merged.append((text, bold, italic, link))
+    return merged
+
+
+def _ctx(bold: bool = False, italic: bool = False) -> Context:
+    ctx = Context(Path("."))
+    ctx.bold = bold
+    ctx.italic = italic
+    return ctx
+
+
+def test_emphasis_fixture_run_count(tmp_path, monkeypatch):
+    coalesced = _render(tmp_path, "emphasis.md")
+    # Same fixture without coalescing, as paragraphs were parsed before it
+    monkeypatch.setattr(elements, "_coalesce_runs", lambda runs: runs)
+    uncoalesced = _render(tmp_path, "emphasis.md")
+
+    assert len(uncoalesced) == 53
+    assert len(coalesced) == 48
+    # Nothing is lost or restyled, only empty and redundant runs go
+    assert _merged(coalesced) == _merged(uncoalesced)
+    assert all(text != "" for text, *_ in coalesced)
+    assert "".join(text for text, *_ in coalesced) == "".join(text for text, *_ in uncoalesced)
+
+
+def test_emphasis_fixture_formatting(tmp_path):
+    runs = _render(tmp_path, "emphasis.md")
+    assert runs[:8] == [
+        ("Plain ", False, False, False),
+        ("bold", True, False, False),
+        (" and ", False, False, False),
+        ("italic", False, True, False),
+        (" and ", False, False, False),
+        ("both", True, True, False),
+        (" words with ", False, False, False),
+        ("more", False, True, False),
+    ]
+    # Nested emphasis keeps the outer formatting either side
+    assert runs[11:14] == [
+        ("Bold with ", True, False, False),
+        ("nested italic", True, True, False),
+        (" inside", True, False, False),
+    ]
+    # Links keep their own runs
+    assert [text for text, _, _, link in runs if link] == [
+        "https://example.com",
+        "a link",
+        "another",
+        "link",
+    ]
+
+
+def test_coalesce_drops_empty_plain_runs():
+    runs = [Run(_ctx(), ""), Run(_ctx(), "text"), Run(_ctx(bold=True), "")]
+    assert [run.text for run in _coalesce_runs(runs)] == ["text"]
+
+
+def test_coalesce_merges_same_formatting():
+    runs = [Run(_ctx(), "a"), Run(_ctx(), "b"), Run(_ctx(bold=True), "c"), Run(_ctx(bold=True), "d"), Run(_ctx(), "e")]
+    coalesced = _coalesce_runs(runs)
+    assert [(run.text, run.ctx.bold) for run in coalesced] == [("ab", False), ("cd", True), ("e", False)]
+
+
+def test_coalesce_keeps_links_and_images():
+    runs = [
+        Run(_ctx(), "a"),
+        Run(_ctx(), "link", link=("https://example.com", True)),
+        Run(_ctx(), "link", link=("https://example.com", True)),
+        Run(_ctx(), "", image=("image.png", "alt", None)),
+        Run(_ctx(), "b"),
+        Run(_ctx(), "c"),
+    ]
+    coalesced = _coalesce_runs(runs)
+    assert [run.text for run in coalesced] == ["a", "link", "link", "", "bc"]
+    assert coalesced[1] is runs[1] and coalesced[2] is runs[2] and coalesced[3] is runs[3]
+
+
+@pytest.mark.parametrize("texts", [[], [""], ["", ""]])
+def test_coalesce_nothing_left(texts):
+    assert _coalesce_runs([Run(_ctx(), text) for text in texts]) == []
+
+
+def test_part_state_dropped_with_document(tmp_path):
+    md_path = FIXTURES / "emphasis.md"
+    Document(md_path.read_text(encoding="utf-8"), md_path).save(tmp_path / "out.docx")
+    gc.collect()
+    # Prototypes and link indexes don't keep rendered documents alive
+    assert len(utils._PARTS) == 0